@@ -1,20 +1,38 @@
 import os
+import re
+import sys
 import subprocess
 import logging
 from google import genai
 import json
+import orjson
 import traceback
-from flask import Flask, render_template, jsonify, request, session, redirect, url_for
-from functools import wraps
-from garminconnect import Garmin
+from flask import Flask, Response, render_template, jsonify, request, session, redirect, url_for, g, has_request_context
+from flask.json.provider import DefaultJSONProvider
+from functools import wraps, lru_cache
+from garminconnect import Garmin, GarminConnectTooManyRequestsError, GarminConnectAuthenticationError
 from datetime import date, timedelta, datetime
 from zoneinfo import ZoneInfo
 from dotenv import load_dotenv
 import threading
 import time
 import random
+import heapq
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections import OrderedDict
+from array import array
+from itertools import accumulate
+from bisect import bisect_left
 import pickle
+import atexit
+import csv
+import io
+import shutil
+from contextlib import contextmanager
+try:
+    import fcntl
+except ImportError: # Windows dev server: one process, so the thread lock alone is enough
+    fcntl = None
 from pb_parser import pb_parse_activity_details
 
 load_dotenv()
@@ -23,35 +41,141 @@ load_dotenv()
 n = lambda x: x if x is not None else 0
 EXCLUDED_ACTS_FILE = 'garmin_cache/excluded_activities.json'
 
+# Activity classification keywords (matched against lowercase typeKey / activityName)
+CYCLING_TYPE_KEYWORDS = ('cycling', 'ride', 'biking', 'virtual', 'indoor', 'road')
+CYCLING_NAME_KEYWORDS = ('zwift', 'ride', 'cycling', 'peloton', 'trainerroad', 'road biking', 'mountain biking', 'road cycling')
+VIRTUAL_TYPE_KEYWORDS = ('virtual', 'indoor')
+VIRTUAL_NAME_KEYWORDS = ('zwift', 'peloton', 'trainerroad')
+# Common Garmin typeKeys that classify on an exact set hit, before any keyword scan
+CYCLE_KEYS = ('cycling', 'road_biking', 'mountain_biking', 'indoor_cycling', 'virtual_ride', 'gravel_cycling')
+RUN_KEYS = ('running', 'trail_running', 'treadmill_running', 'indoor_running', 'track_running')
+VIRTUAL_KEYS = ('virtual_ride', 'indoor_cycling', 'virtual_run', 'indoor_running', 'indoor_rowing')
+_CYCLE_SET = frozenset(CYCLE_KEYS)
+_RUN_SET = frozenset(RUN_KEYS)
+_VIRTUAL_SET = frozenset(VIRTUAL_KEYS)
+# One compiled alternation per keyword list: a single C-level scan instead of N substring checks
+CYCLING_TYPE_RE = re.compile('|'.join(map(re.escape, CYCLING_TYPE_KEYWORDS)))
+CYCLING_NAME_RE = re.compile('|'.join(map(re.escape, CYCLING_NAME_KEYWORDS)))
+VIRTUAL_TYPE_RE = re.compile('|'.join(map(re.escape, VIRTUAL_TYPE_KEYWORDS)))
+VIRTUAL_NAME_RE = re.compile('|'.join(map(re.escape, VIRTUAL_NAME_KEYWORDS)))
+# Outermost {...} object in a model response (greedy, spans newlines)
+_AI_JSON_RE = re.compile(r'\{.*\}', re.DOTALL)
+
+# Fixed nutrition prompts, filled with str.format per request
+FOOD_ESTIMATE_PROMPT = """Analyze these food items: {items}
+My Goals: Weight loss, low cholesterol.
+Return ONLY a JSON array of objects, one for each item, with:
+name (string), calories (int), cholesterol_mg (int), protein_g (int), carbs_g (int), sugar_g (int), fat_g (int), caffeine_mg (int), ai_note (str).
+"""
+INGREDIENT_ESTIMATE_PROMPT = """Estimate nutritional values for these ingredients collectively and individually:
+{ingredients}
+
+Return ONLY a JSON array where each object corresponds to an ingredient and has:
+calories (int), cholesterol_mg (int), protein_g (int), carbs_g (int), sugar_g (int), fat_g (int), caffeine_mg (int).
+"""
+NUTRITION_ANALYSIS_PROMPT = """You are 'Athlete Intelligence', a supportive but strict sports coach. Analyze my nutrition for {date_str} with a "Performance Fueling" perspective.
+My Goals: Weight loss, low cholesterol.
+
+Metabolic Data:
+- Total Energy Out: {total_out} kcal (Resting: {resting_out}, Active: {active_out})
+- Total Energy In: {total_in} kcal
+- Total Cholesterol: {total_chol} mg
+- Logged Foods: {food_list}
+
+7-Day Calorie History (for trend analysis): {history_str}
+
+- Address me directly as 'you'.
+- I still have {meals_remaining} expected for the rest of the day since it is {time_str}.
+- DO NOT praise a 'significant deficit' as an achievement if the day is not over; frame it as 'Available Fuel Capacity'.
+- Focus on Performance Fueling: directly tie my active calories to my food intake (e.g., "You burned 1,200 calories riding today; ensure your next meal has heavy carbs to replenish glycogen"). Be strict if I am eating junk while trying to fuel performance.
+
+Return plain text (no markdown blocks or JSON formatting). We will inject it directly as HTML.
+Please structure your response as:
+2-3 sentences analyzing energy balance and cholesterol. Explicitly point out if yesterday affected today. <br><br><strong>Action Plan:</strong> 1-2 sharp, strict sentences of advice for my next meal or rest of day.
+"""
+# The analysis only needs the latest foods; the totals already cover the whole day
+NUTRITION_ANALYSIS_MAX_FOODS = 15
+
+def parse_ai_json_array(text):
+    """Parse the outermost [...] in a model response, ignoring ```json fences or chatter around it."""
+    start = text.find('[')
+    end = text.rfind(']') + 1
+    return orjson.loads(text[start:end] if start != -1 and end > start else text)
+
+def parse_ai_json_object(text):
+    """Parse the outermost {...} in a model response, ignoring ```json fences or chatter around it."""
+    match = _AI_JSON_RE.search(text)
+    return orjson.loads(match.group(0) if match else text.strip())
+
+def _activity_type(act):
+    """activityType from list endpoints, or activityTypeDTO from the single-activity endpoint."""
+    return act.get('activityType') or act.get('activityTypeDTO') or {}
+
+def type_key_of(act, default='other'):
+    """activityType.typeKey, interned: there are only a few dozen, so every activity shares one string each."""
+    return sys.intern(_activity_type(act).get('typeKey') or default)
+
+def normalize_activity(act):
+    """Cache the fields hot loops read on the activity: lowercase typeKey/activityName as
+    '_tk'/'_an' and null-safe distance (m) / duration (s) as '_dist'/'_dur'."""
+    act['_tk'] = sys.intern((_activity_type(act).get('typeKey') or '').lower())
+    act['_an'] = (act.get('activityName') or '').lower()
+    act['_dist'] = n(act.get('distance'))
+    act['_dur'] = n(act.get('duration'))
+    return act
+
+def _activity_keys(act):
+    """Return (typeKey, activityName) lowercased, using the normalized fields when present."""
+    tk = act.get('_tk')
+    if tk is None:
+        return (_activity_type(act).get('typeKey') or '').lower(), (act.get('activityName') or '').lower()
+    return tk, act['_an']
+
 def is_cycling_activity(act):
     """Reliably determine if an activity is cycling-related."""
     if not act or not isinstance(act, dict): return False
-    tk = act.get('activityType', {}).get('typeKey', '').lower()
-    an = act.get('activityName', '').lower()
+    tk, an = _activity_keys(act)
+    if tk in _CYCLE_SET: return True
     # Check typeKey and activityName for various cycling indicators
-    return any(k in tk for k in ['cycling', 'ride', 'biking', 'virtual', 'indoor', 'road']) or \
-           any(k in an for k in ['zwift', 'ride', 'cycling', 'peloton', 'trainerroad', 'road biking', 'mountain biking', 'road cycling'])
+    return bool(CYCLING_TYPE_RE.search(tk) or CYCLING_NAME_RE.search(an))
 
 def is_running_activity(act):
     """Reliably determine if an activity is running-related."""
     if not act or not isinstance(act, dict): return False
-    tk = act.get('activityType', {}).get('typeKey', '').lower()
-    an = act.get('activityName', '').lower()
-    return 'running' in tk or 'run' in tk or 'run' in an or 'running' in an
+    tk, an = _activity_keys(act)
+    return tk in _RUN_SET or 'run' in tk or 'run' in an
 
 def is_virtual_ride(act):
     """Identify if a cycling activity is virtual (indoor)."""
     if not act or not isinstance(act, dict): return False
-    tk = act.get('activityType', {}).get('typeKey', '').lower()
-    an = act.get('activityName', '').lower()
-    return any(k in tk for k in ['virtual', 'indoor']) or any(k in an for k in ['zwift', 'peloton', 'trainerroad'])
+    tk, an = _activity_keys(act)
+    if tk in _VIRTUAL_SET: return True
+    return bool(VIRTUAL_TYPE_RE.search(tk) or VIRTUAL_NAME_RE.search(an))
 
 # Timezone Configuration
 EST = ZoneInfo("America/New_York")
 
+@lru_cache(maxsize=1)
+def _today_for_minute(minute):
+    # EST offsets are whole hours, so a wall-clock minute never straddles local midnight
+    return datetime.fromtimestamp(minute * 60, EST).date()
+
 def get_today():
-    """Get today's date in Eastern Standard Time."""
-    return datetime.now(EST).date()
+    """Get today's date in Eastern Standard Time (memoized on flask.g for the current request).
+
+    Calls within the same minute share one date object, which keeps lru_cache'd range
+    resolvers (see resolve_heatmap_range) hitting.
+    """
+    if has_request_context():
+        today = g.get('today')
+        if today is None:
+            today = g.today = _today_for_minute(int(time.time() // 60))
+        return today
+    return _today_for_minute(int(time.time() // 60))
+
+def parse_garmin_datetime(s):
+    """Parse Garmin's fixed 'YYYY-MM-DD HH:MM:SS' format by slicing (much faster than strptime)."""
+    return datetime(int(s[0:4]), int(s[5:7]), int(s[8:10]), int(s[11:13]), int(s[14:16]), int(s[17:19]))
 
 def get_git_command():
     """Find the git command, checking common paths as fallback when PATH is minimal."""
@@ -117,7 +241,25 @@ APP_VERSION = get_app_version()
 
 # Gemini configuration is now handled per-client instance
 
+ORJSON_OPTS = orjson.OPT_NON_STR_KEYS
+# HTTP responses keep Flask's default output: sorted keys, and dates handed to the provider's
+# default() (HTTP-date strings) instead of orjson's native ISO format
+RESPONSE_ORJSON_OPTS = ORJSON_OPTS | orjson.OPT_SORT_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson, so every jsonify() uses the C encoder."""
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, option=RESPONSE_ORJSON_OPTS, default=self.default).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(orjson.dumps(obj, option=RESPONSE_ORJSON_OPTS, default=self.default), mimetype=self.mimetype)
+
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 app.secret_key = os.getenv("FLASK_SECRET_KEY", "super-secret-dev-key")
 APP_PASSWORD = os.getenv("APP_PASSWORD", "admin") # Default for dev, set in Render
 logging.basicConfig(level=logging.INFO)
@@ -125,6 +267,9 @@ logger = logging.getLogger(__name__)
 
 # Global client cache (simple version)
 garmin_client = None
+garmin_client_lock = threading.Lock()
+genai_client = None
+genai_client_lock = threading.Lock()
 
 # Settings management
 SETTINGS_FILE = 'settings.json'
@@ -135,7 +280,12 @@ DEFAULT_SETTINGS = {
 
 # Nutrition Storage
 FOOD_LOGS_FILE = 'food_logs.json'
+FOOD_LOGS_JOURNAL = 'food_logs.jsonl' # append-only inserts/tombstones on top of FOOD_LOGS_FILE
+FOOD_LOGS_LOCK_FILE = 'food_logs.lock' # flock target shared by the gunicorn workers
 CUSTOM_FOODS_FILE = 'custom_foods.json'
+NUTRITION_CACHE_FILE = 'nutrition_cache.json' # normalized food name -> last AI estimate
+NUTRITION_CACHE_TTL = 30 * 86400 # 30 Days
+NUTRITION_CACHE_MAX = 10000
 
 # Caching
 user_profile_cache = {'data': None, 'timestamp': None}
@@ -194,19 +344,161 @@ stats_cache = {}
 weight_cache = {'value': None, 'timestamp': 0}
 user_profile_cache = {'data': None, 'timestamp': 0}
 calorie_cache = {}
+json_cache = {} # path -> ((mtime_ns, size), parsed data), see load_json_cached
+# Mileage summaries: recomputed at most every TTL; completed past years are kept for the process lifetime
+LONGTERM_CACHE_TTL = 600 # 10 Minutes
+YTD_CACHE_TTL = 900 # 15 Minutes
+longterm_cache = {'data': None, 'date': None, 'timestamp': 0}
+ytd_year_cache = {}
+WEEKLY_IM_CACHE_TTL = 3600 # 1 Hour
+weekly_im_cache = {}
 offline_mode_active = False
 
 def load_json(path, default):
     if os.path.exists(path):
         try:
-            with open(path, 'r') as f:
-                return json.load(f)
+            with open(path, 'rb') as f:
+                raw = f.read()
+            try:
+                return orjson.loads(raw)
+            except orjson.JSONDecodeError:
+                return json.loads(raw) # json.dump writes NaN/Infinity, which orjson rejects
         except: return default
     return default
 
 def save_json(path, data):
-    with open(path, 'w') as f:
+    # Write a private temp file and swap it in, so a concurrent reader never sees a half-written file
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, 'w') as f:
         json.dump(data, f, indent=2)
+    os.replace(tmp, path)
+    if path in json_cache:
+        # Keep the cached copy in step with what we just wrote, so the next read skips the re-parse
+        st = os.stat(path)
+        json_cache[path] = ((st.st_mtime_ns, st.st_size), data)
+
+def load_json_cached(path, default):
+    """load_json for hot read paths: reuse the parsed data until the file's mtime/size changes
+    (also catches writes from the other gunicorn worker). Treat the result as read-only."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return default
+    sig = (st.st_mtime_ns, st.st_size)
+    entry = json_cache.get(path)
+    if entry and entry[0] == sig:
+        return entry[1]
+    data = load_json(path, default)
+    json_cache[path] = (sig, data)
+    return data
+
+food_logs_lock = threading.Lock()
+
+@contextmanager
+def food_logs_locked(shared=False):
+    """Hold the food log lock: an flock on FOOD_LOGS_LOCK_FILE so both gunicorn workers see it
+    (flock also excludes other threads, each opens its own descriptor), else food_logs_lock."""
+    if fcntl is None:
+        with food_logs_lock:
+            yield
+        return
+    with open(FOOD_LOGS_LOCK_FILE, 'a') as lf:
+        fcntl.flock(lf, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lf, fcntl.LOCK_UN)
+
+def load_food_logs():
+    """All food log entries: the FOOD_LOGS_FILE base plus the FOOD_LOGS_JOURNAL replay. Read-only, cached."""
+    base = load_json_cached(FOOD_LOGS_FILE, [])
+    try:
+        st = os.stat(FOOD_LOGS_JOURNAL)
+    except OSError:
+        return base
+    base_entry = json_cache.get(FOOD_LOGS_FILE)
+    sig = (st.st_mtime_ns, st.st_size, base_entry[0] if base_entry else None)
+    entry = json_cache.get(FOOD_LOGS_JOURNAL)
+    if entry and entry[0] == sig:
+        return entry[1]
+    
+    # Rebuild under the lock so a compaction can't swap the base between reading it and the journal
+    with food_logs_locked(shared=True):
+        return _replay_food_logs()
+
+def _replay_food_logs():
+    """Read base + journal and cache the merged list. Caller holds food_logs_locked()."""
+    base = load_json_cached(FOOD_LOGS_FILE, [])
+    try:
+        st = os.stat(FOOD_LOGS_JOURNAL)
+    except OSError:
+        return base # Compacted away while we waited for the lock
+    base_entry = json_cache.get(FOOD_LOGS_FILE)
+    sig = (st.st_mtime_ns, st.st_size, base_entry[0] if base_entry else None)
+    
+    logs = list(base)
+    tombs = set()
+    with open(FOOD_LOGS_JOURNAL, 'rb') as f:
+        for line in f:
+            if not line.strip(): continue
+            try:
+                rec = orjson.loads(line)
+            except orjson.JSONDecodeError:
+                continue # torn write from a crash mid-append
+            if '_tomb' in rec:
+                tombs.add(rec['_tomb'])
+            else:
+                logs.append(rec)
+    if tombs:
+        logs = [l for l in logs if l.get('id') not in tombs]
+    json_cache[FOOD_LOGS_JOURNAL] = (sig, logs)
+    return logs
+
+food_log_index = (None, {}, {}) # (logs list it was built from, id -> entry, date -> entries)
+
+def _food_log_index():
+    """Indexes over load_food_logs(), rebuilt only when the underlying list changes."""
+    global food_log_index
+    logs = load_food_logs()
+    if food_log_index[0] is not logs:
+        by_id, by_date = {}, {}
+        for l in logs:
+            by_id[l.get('id')] = l
+            by_date.setdefault(l.get('date'), []).append(l)
+        food_log_index = (logs, by_id, by_date)
+    return food_log_index
+
+def food_logs_by_id():
+    return _food_log_index()[1]
+
+def food_logs_by_date():
+    """'YYYY-MM-DD' -> that day's entries, in log order. Read-only."""
+    return _food_log_index()[2]
+
+def append_food_logs(records):
+    """O(1) write path: append entries (or {'_tomb': id} deletions) to the journal."""
+    data = b''.join(orjson.dumps(r) + b'\n' for r in records)
+    with food_logs_locked(), open(FOOD_LOGS_JOURNAL, 'ab') as f:
+        f.write(data)
+
+def compact_food_logs():
+    """Fold the journal back into FOOD_LOGS_FILE (at startup, in each worker).
+
+    The exclusive lock keeps the other worker's appends and rebuilds out until the new base has
+    been swapped in and the journal it covers removed, so no appended line is dropped.
+    """
+    if not os.path.exists(FOOD_LOGS_JOURNAL):
+        return
+    try:
+        with food_logs_locked():
+            if not os.path.exists(FOOD_LOGS_JOURNAL):
+                return # The other worker compacted first
+            logs = _replay_food_logs()
+            save_json(FOOD_LOGS_FILE, logs)
+            os.remove(FOOD_LOGS_JOURNAL)
+        logger.info(f"Compacted food log journal ({len(logs)} entries)")
+    except Exception as e:
+        logger.warning(f"Food log compaction failed: {e}")
 
 def load_settings():
     """Load settings from JSON file, return defaults if not found."""
@@ -228,7 +520,23 @@ def save_settings(settings):
         logger.error(f"Failed to save settings: {e}")
         return False
 
+def get_genai_client():
+    """Shared Gemini client, so every AI endpoint reuses one HTTP connection pool."""
+    global genai_client
+    if genai_client is None:
+        with genai_client_lock:
+            if genai_client is None:
+                genai_client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+    return genai_client
+
 def get_garmin_client():
+    if garmin_client:
+        return garmin_client
+    # Serialize logins so concurrent callers (e.g. warmup and the first request) share one auth round-trip
+    with garmin_client_lock:
+        return _login_garmin_client()
+
+def _login_garmin_client():
     global garmin_client, offline_mode_active
     if garmin_client:
         return garmin_client
@@ -263,31 +571,69 @@ def get_garmin_client():
         offline_mode_active = True
         return None
 
+# Garmin throttling: jittered exponential backoff on 429/5xx, with a shared cool-down
+# so one rate-limited worker pauses the whole fan-out instead of every thread hammering on.
+GARMIN_RETRY_ATTEMPTS = 4
+GARMIN_BACKOFF_BASE = 0.25
+GARMIN_BACKOFF_CAP = 4.0
+GARMIN_TRANSIENT_STATUSES = (500, 502, 503, 504)
+garmin_cooldown_until = 0.0
+# Ceiling on in-flight Garmin calls per process, however many pools/requests are fanning out
+GARMIN_MAX_CONCURRENCY = 8
+garmin_semaphore = threading.BoundedSemaphore(GARMIN_MAX_CONCURRENCY)
+
+def garmin_error_status(e):
+    """HTTP status behind a Garmin client error. garminconnect wraps the requests HTTPError,
+    so look along the exception chain for the first one carrying a response."""
+    seen = 0
+    while e is not None and seen < 5:
+        status = getattr(getattr(e, 'response', None), 'status_code', None)
+        if status is not None:
+            return status
+        e = e.__cause__ or e.__context__
+        seen += 1
+    return None
+
+def _is_network_error(e):
+    """No HTTP answer at all (timeout, reset, DNS): requests' errors are OSErrors somewhere in the chain."""
+    seen = 0
+    while e is not None and seen < 5:
+        if isinstance(e, OSError):
+            return True
+        e = e.__cause__ or e.__context__
+        seen += 1
+    return False
+
 def garmin_request(func, *args, **kwargs):
-    """Wrapper to handle Garmin API calls with retries and session auto-saving."""
-    global garmin_client
-    max_retries = 3
-    for attempt in range(max_retries):
+    """Call a Garmin client function under the shared concurrency cap, retrying rate limits,
+    transient 5xx / network failures and expired sessions with jittered exponential backoff."""
+    global garmin_client, garmin_cooldown_until
+    for attempt in range(GARMIN_RETRY_ATTEMPTS):
+        wait = garmin_cooldown_until - time.time()
+        if wait > 0:
+            time.sleep(wait)
         try:
-            # JITTER: Random delay to prevent Rate Limits and IP Bans
-            time.sleep(random.uniform(1.5, 3.5))
-            
-            res = func(*args, **kwargs)
-            
-            # Note: garminconnect v0.3+ automatically saves tokens after refresh to tokenstore_path.
-            # No manual garth.dump() is needed.
-            return res
+            with garmin_semaphore:
+                # Note: garminconnect v0.3+ automatically saves tokens after refresh to tokenstore_path.
+                return func(*args, **kwargs)
         except Exception as e:
-            if attempt < max_retries - 1:
-                wait = (attempt + 1) * 2
-                logger.warning(f"Garmin API error: {e}. Retrying in {wait}s... (Attempt {attempt + 1}/{max_retries})")
-                time.sleep(wait)
-                # Force re-login on next attempt if it seems like a session issue
-                if any(err in str(e).lower() for err in ["403", "session", "login", "auth", "expired"]):
-                    garmin_client = None
-            else:
-                logger.error(f"Garmin API failed after {max_retries} attempts: {e}")
-                raise e
+            status = garmin_error_status(e)
+            rate_limited = isinstance(e, GarminConnectTooManyRequestsError) or status == 429
+            auth_failed = isinstance(e, GarminConnectAuthenticationError) or status in (401, 403)
+            is_transient = (rate_limited or auth_failed or status in GARMIN_TRANSIENT_STATUSES
+                            or (status is None and _is_network_error(e)))
+            if not is_transient or attempt == GARMIN_RETRY_ATTEMPTS - 1:
+                if is_transient:
+                    logger.error(f"Garmin API failed after {GARMIN_RETRY_ATTEMPTS} attempts: {e}")
+                raise
+            delay = min(GARMIN_BACKOFF_CAP, GARMIN_BACKOFF_BASE * 2 ** attempt) + random.uniform(0, 0.25)
+            if rate_limited:
+                garmin_cooldown_until = max(garmin_cooldown_until, time.time() + delay)
+            if auth_failed:
+                # Force re-login for the next caller of get_garmin_client
+                garmin_client = None
+            logger.warning(f"Garmin transient error (status={status}, attempt {attempt+1}/{GARMIN_RETRY_ATTEMPTS}): {e}. Retrying in {delay:.2f}s...")
+            time.sleep(delay)
 
 def get_user_profile_data(client):
     """Get user profile data (age, height, gender, weight) with caching for BMR calculation."""
@@ -377,41 +723,272 @@ def get_calorie_data(client, date_str):
 # CACHE SYSTEM
 # ==============================================================================
 
+POLY_SCALE = 1e6 # Micro-degrees (~0.1m), fits comfortably in int32
+
+def encode_polyline(compact):
+    """Quantize [[lat, lon], ...] to micro-degrees and delta-encode into one interleaved int32 array."""
+    out = array('i')
+    prev_lat = prev_lon = 0
+    for lat, lon in compact:
+        q_lat = round(lat * POLY_SCALE)
+        q_lon = round(lon * POLY_SCALE)
+        out.append(q_lat - prev_lat)
+        out.append(q_lon - prev_lon)
+        prev_lat, prev_lon = q_lat, q_lon
+    return out
+
+def decode_polyline(encoded):
+    """Inverse of encode_polyline: cumulative-sum the deltas back to [[lat, lon], ...] floats."""
+    lats = accumulate(encoded[0::2])
+    lons = accumulate(encoded[1::2])
+    return [[lat / POLY_SCALE, lon / POLY_SCALE] for lat, lon in zip(lats, lons)]
+
+POLY_SIMPLIFY_TOLERANCE = 1e-4 # Degrees (~11 m): below what the route heatmap can draw
+POLY_MAX_POINTS = 500
+
+def simplify_polyline(points, tolerance=POLY_SIMPLIFY_TOLERANCE):
+    """Shrink [[lat, lon], ...] with a radial-distance pre-pass followed by iterative Douglas-Peucker."""
+    if len(points) < 3:
+        return points
+    tol_sq = tolerance * tolerance
+    
+    # Radial pass: drop points that sit within tolerance of the last kept one (GPS jitter, stops)
+    pts = [points[0]]
+    for p in points[1:]:
+        q = pts[-1]
+        if (p[0] - q[0]) ** 2 + (p[1] - q[1]) ** 2 > tol_sq:
+            pts.append(p)
+    if pts[-1] is not points[-1]:
+        pts.append(points[-1])
+    if len(pts) < 3:
+        return pts
+    
+    # Douglas-Peucker with an explicit stack: keep the farthest point of each span while it is off-line
+    keep = [False] * len(pts)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(pts) - 1)]
+    while stack:
+        first, last = stack.pop()
+        ax, ay = pts[first]
+        dx, dy = pts[last][0] - ax, pts[last][1] - ay
+        seg_sq = dx * dx + dy * dy
+        max_sq, index = 0.0, 0
+        for i in range(first + 1, last):
+            px, py = pts[i][0] - ax, pts[i][1] - ay
+            if seg_sq:
+                cross = dx * py - dy * px
+                d_sq = cross * cross / seg_sq
+            else:
+                d_sq = px * px + py * py
+            if d_sq > max_sq:
+                max_sq, index = d_sq, i
+        if max_sq > tol_sq:
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+    return [p for p, k in zip(pts, keep) if k]
+
 CACHE_FILE = 'polyline_cache.pkl'
+CACHE_JOURNAL_FILE = 'polyline_cache.jrnl'
+CACHE_COMPACT_INTERVAL = 300 # Seconds between journal compactions
 polyline_lock = threading.Lock()
 
 class PolylineCache:
+    """Polyline cache: pickle snapshot + append-only journal, compacted periodically by a daemon thread."""
     def __init__(self):
         self.cache = {}
+        self._dirty = 0
+        self._snapshot_mtime = None
+        self._save_lock = threading.Lock()
         self.load()
+        self._journal = open(CACHE_JOURNAL_FILE, 'ab', buffering=1 << 20)
+        atexit.register(self.flush)
+        threading.Thread(target=self._compactor, daemon=True).start()
+
+    def _read_snapshot(self):
+        """Unpickle CACHE_FILE, remembering its mtime so saves can tell if another worker rewrote it."""
+        self._snapshot_mtime = os.stat(CACHE_FILE).st_mtime_ns
+        with open(CACHE_FILE, 'rb') as f:
+            return pickle.load(f)
+
+    def _replay(self, path):
+        """Apply journal records from path to self.cache; returns how many were applied."""
+        replayed = 0
+        with open(path, 'rb') as f:
+            while True:
+                header = f.read(4)
+                if len(header) < 4: break
+                size = int.from_bytes(header, 'little')
+                record = f.read(size)
+                if len(record) < size: break # Torn write at crash, drop it
+                aid, polyline = pickle.loads(record)
+                self.cache[aid] = polyline
+                replayed += 1
+        return replayed
 
     def load(self):
         if os.path.exists(CACHE_FILE):
             try:
-                with open(CACHE_FILE, 'rb') as f:
-                    self.cache = pickle.load(f)
+                self.cache = self._read_snapshot()
             except Exception as e:
                 logger.error(f"Failed to load cache: {e}")
                 self.cache = {}
 
+        # Migrate legacy [[lat, lon]] lists so the next snapshot holds only int32 arrays,
+        # which unpickle as flat buffer copies instead of millions of float objects.
+        legacy = [aid for aid, poly in self.cache.items() if poly and isinstance(poly, list)]
+        for aid in legacy:
+            self.cache[aid] = encode_polyline(self.cache[aid])
+        if legacy:
+            logger.info(f"Migrated {len(legacy)} legacy polylines to encoded arrays.")
+
+        # Replay any records written since the last snapshot. A rotated journal is
+        # left behind only if we crashed mid-save; replaying it again is harmless.
+        replayed = 0
+        for path in (CACHE_JOURNAL_FILE + '.old', CACHE_JOURNAL_FILE):
+            if not os.path.exists(path): continue
+            try:
+                replayed += self._replay(path)
+            except Exception as e:
+                logger.error(f"Failed to replay cache journal {path}: {e}")
+        self._dirty = replayed + len(legacy)
+
     def save(self):
-        try:
-            with open(CACHE_FILE, 'wb') as f:
-                pickle.dump(self.cache, f, protocol=pickle.HIGHEST_PROTOCOL)
-        except Exception as e:
-            logger.error(f"Failed to save cache: {e}")
+        """Write a full snapshot and drop the journal it covers (compaction)."""
+        old_journal = CACHE_JOURNAL_FILE + '.old'
+        with self._save_lock:
+            try:
+                # The other gunicorn worker shares these files: if it compacted since we last
+                # read/wrote the snapshot, fold its entries in so neither snapshot drops the other's.
+                disk = None
+                if os.path.exists(CACHE_FILE) and os.stat(CACHE_FILE).st_mtime_ns != self._snapshot_mtime:
+                    disk = self._read_snapshot()
+                # Only the merge, copy and journal rotation hold polyline_lock; set() keeps
+                # journaling into the emptied file while the snapshot is pickled.
+                with polyline_lock:
+                    if disk:
+                        for aid, poly in disk.items():
+                            self.cache.setdefault(aid, poly)
+                    self._journal.flush()
+                    # Pick up records the other worker journaled since the last compaction
+                    self._replay(CACHE_JOURNAL_FILE)
+                    snap = self.cache.copy()
+                    with open(CACHE_JOURNAL_FILE, 'rb') as src, open(old_journal, 'ab') as dst:
+                        shutil.copyfileobj(src, dst)
+                    self._journal.seek(0)
+                    self._journal.truncate()
+                    self._dirty = 0
+                tmp = CACHE_FILE + '.tmp'
+                with open(tmp, 'wb', buffering=1 << 20) as f:
+                    pickle.dump(snap, f, protocol=5)
+                os.replace(tmp, CACHE_FILE)
+                self._snapshot_mtime = os.stat(CACHE_FILE).st_mtime_ns
+                os.remove(old_journal)
+            except Exception as e:
+                logger.error(f"Failed to save cache: {e}")
+
+    def flush(self):
+        """Push buffered journal records to disk (at exit), so a restart doesn't refetch them."""
+        with polyline_lock:
+            try:
+                self._journal.flush()
+            except Exception as e:
+                logger.error(f"Failed to flush cache journal: {e}")
+
+    def _compactor(self):
+        while True:
+            time.sleep(CACHE_COMPACT_INTERVAL)
+            if self._dirty:
+                self.save()
 
     def get(self, activity_id):
-        return self.cache.get(activity_id)
+        poly = self.cache.get(activity_id)
+        # Older cache files hold plain [[lat, lon]] lists; newer entries are encoded arrays
+        if isinstance(poly, array):
+            return decode_polyline(poly)
+        return poly
 
     def set(self, activity_id, polyline):
+        if polyline:
+            polyline = encode_polyline(polyline)
+        record = pickle.dumps((activity_id, polyline), protocol=5)
         with polyline_lock:
             self.cache[activity_id] = polyline
-            # Auto-save every 50 updates or so could be added, but for now explicitly called
+            try:
+                self._journal.write(len(record).to_bytes(4, 'little') + record)
+                self._dirty += 1
+            except Exception as e:
+                logger.error(f"Failed to journal polyline {activity_id}: {e}")
     
     def has(self, activity_id):
         return activity_id in self.cache
 
+# Activity details cache: small in-memory LRU in front of per-activity JSON files.
+# Details are large but stable, so warmup, insights and the activity view share one fetch.
+DETAILS_CACHE_DIR = os.path.join('garmin_cache', 'activity_details')
+DETAILS_CACHE_TTL = 86400 # 1 Day
+DETAILS_MEMORY_MAX = 32
+DETAILS_DISK_MAX = 200 # Files kept in DETAILS_CACHE_DIR; expired and then oldest are pruned on write
+details_cache = OrderedDict()
+details_lock = threading.Lock()
+
+def _prune_details_dir():
+    """Drop expired detail files, then the oldest ones past DETAILS_DISK_MAX."""
+    cutoff = time.time() - DETAILS_CACHE_TTL
+    files = []
+    with os.scandir(DETAILS_CACHE_DIR) as it:
+        for f in it:
+            if not f.name.endswith('.json'): continue
+            try:
+                mtime = f.stat().st_mtime
+            except OSError:
+                continue # Removed by the other worker
+            files.append((mtime, f.path))
+    files.sort()
+    excess = len(files) - DETAILS_DISK_MAX
+    for i, (mtime, path) in enumerate(files):
+        if i >= excess and mtime >= cutoff: break
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def get_details_cached(client, activity_id, store=True):
+    """Get activity details from memory, then disk, then Garmin (within DETAILS_CACHE_TTL).
+
+    store=False reuses cached copies but doesn't keep a new fetch: bulk background passes that
+    only want the polyline would otherwise flood the memory LRU and the disk cache.
+    """
+    key = str(activity_id)
+    now = time.time()
+    with details_lock:
+        entry = details_cache.get(key)
+        if entry and now - entry['timestamp'] < DETAILS_CACHE_TTL:
+            details_cache.move_to_end(key)
+            return entry['data']
+
+    path = os.path.join(DETAILS_CACHE_DIR, f"{key}.json")
+    entry = load_json(path, None)
+    if not entry or now - entry.get('timestamp', 0) >= DETAILS_CACHE_TTL:
+        data = garmin_request(client.get_activity_details, activity_id)
+        entry = {'data': data, 'timestamp': now}
+        if not store:
+            return data
+        if data:
+            os.makedirs(DETAILS_CACHE_DIR, exist_ok=True)
+            save_json(path, entry)
+            try:
+                _prune_details_dir()
+            except OSError as e:
+                logger.warning(f"Activity details cache prune failed: {e}")
+
+    with details_lock:
+        details_cache[key] = entry
+        details_cache.move_to_end(key)
+        while len(details_cache) > DETAILS_MEMORY_MAX:
+            details_cache.popitem(last=False)
+    return entry['data']
+
 # ==============================================================================
 # PERSISTENT SYNC SYSTEM
 # ==============================================================================
@@ -450,16 +1027,66 @@ class GarminPersistence:
         path = os.path.join(GarminPersistence.BASE_DIR, f"{metric}.json")
         save_json(path, data)
 
+RANGE_SYNC_WORKERS = 8 # Concurrent per-day requests for metrics without a range endpoint
+# Metrics Garmin only serves one day per request; get_range fans their gaps out concurrently
+DAILY_ONLY_METRICS = ('stats', 'sleep', 'hrv', 'stress', 'intensity_minutes', 'hr', 'hydration')
+# Shared pool for leaf Garmin/cache lookups, reused across requests instead of spinning threads up each time.
+# Only submit work that never waits on this pool itself, or a saturated pool can deadlock.
+garmin_http_pool = ThreadPoolExecutor(max_workers=RANGE_SYNC_WORKERS, thread_name_prefix='garmin-http')
+atexit.register(garmin_http_pool.shutdown, wait=False)
+# Shared pool for a request's top-level fan-out (dashboard sources, YTD years, insight enrichment).
+# Its tasks may wait on garmin_http_pool, but must never submit back into request_pool.
+request_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix='request-fanout')
+atexit.register(request_pool.shutdown, wait=False)
+# Runs background_polyline_fetcher jobs (one per range/warmup generation); each job fans out on its own
+# POLYLINE_FETCH_WORKERS pool. Queued jobs that were superseded while waiting exit on their first check.
+POLYLINE_FETCH_JOBS = 2
+polyline_fetch_pool = ThreadPoolExecutor(max_workers=POLYLINE_FETCH_JOBS, thread_name_prefix='polyfetch')
+atexit.register(polyline_fetch_pool.shutdown, wait=False, cancel_futures=True)
+
+# In-memory LRU of per-day summaries in front of the month files ('hr' is excluded: full-day samples are large).
+# Closed days never change, so they live long; the last few days are rechecked against the disk rules often.
+DAY_CACHE_METRICS = ('stats', 'sleep', 'hrv', 'stress', 'intensity_minutes', 'hydration')
+DAY_CACHE_TTL_PAST = 30 * 86400 # 30 Days
+DAY_CACHE_TTL_RECENT = 300 # 5 Minutes
+DAY_CACHE_MAX = 20000
+
 class GarminSyncManager:
     """Central manager for syncing and retrieving Garmin data with local priority."""
     
     def __init__(self, client):
         self.client = client
         self.sync_times = {}
-
-    def get_metric_for_date(self, metric, date_str, force_refresh=False):
-        """Get metric for a specific day, syncing if missing."""
-        month_data = GarminPersistence.load_month(metric, date_str)
+        self.day_cache = OrderedDict()
+        self.day_cache_lock = threading.Lock()
+
+    def get_metric_for_date(self, metric, date_str, force_refresh=False, month_data=None):
+        """Get metric for a specific day, syncing if missing. Callers iterating a range may
+        pass the already-loaded month_data to skip re-reading the month file."""
+        cacheable = metric in DAY_CACHE_METRICS
+        key = (metric, date_str)
+        if cacheable and not force_refresh:
+            with self.day_cache_lock:
+                hit = self.day_cache.get(key)
+                if hit and hit[0] > time.time():
+                    self.day_cache.move_to_end(key)
+                    return hit[1]
+
+        val = self._get_metric_for_date(metric, date_str, force_refresh, month_data)
+
+        if cacheable and val is not None:
+            recent = date_str >= (get_today() - timedelta(days=3)).isoformat()
+            expires = time.time() + (DAY_CACHE_TTL_RECENT if recent else DAY_CACHE_TTL_PAST)
+            with self.day_cache_lock:
+                self.day_cache[key] = (expires, val)
+                self.day_cache.move_to_end(key)
+                while len(self.day_cache) > DAY_CACHE_MAX:
+                    self.day_cache.popitem(last=False)
+        return val
+
+    def _get_metric_for_date(self, metric, date_str, force_refresh, month_data):
+        if month_data is None:
+            month_data = GarminPersistence.load_month(metric, date_str)
         
         # Don't use cache for today or recently if it's older than threshold (heart rate/steps change)
         today = get_today()
@@ -499,86 +1126,8 @@ class GarminSyncManager:
         # Sync required
         logger.info(f"Syncing {metric} for {date_str}...")
         try:
-            if metric == 'stats':
-                res = self.client.get_stats(date_str)
-                
-                # Robust Max HR fetching
-                max_v = n(res.get('maxHeartRate')) if res else 0
-                rhr_v = n(res.get('restingHeartRate')) if res else 0
-                
-                if not max_v or not rhr_v:
-                    # Fallback to detailed heart rate for missing extremes
-                    hr_det = self.client.get_heart_rates(date_str) or {}
-                    if not max_v: max_v = hr_det.get('maxHeartRate') or 0
-                    if not rhr_v: rhr_v = hr_det.get('sleepingRestingHeartRate') or hr_det.get('restingHeartRate') or 0
-
-                data = {
-                    'total': n(res.get('totalKilocalories') or res.get('totalCalories')) if res else 0,
-                    'active': n(res.get('activeKilocalories') or res.get('activeCalories')) if res else 0,
-                    'resting': n(res.get('bmrKilocalories') or res.get('bmrCalories') or res.get('restingCalories')) if res else 0,
-                    'steps': n(res.get('totalSteps')) if res else 0,
-                    'steps_goal': n(res.get('totalStepsGoal')) if res else 10000,
-                    'resting_hr': rhr_v,
-                    'max_hr': max_v,
-                    'min_hr': n(res.get('minHeartRate')) if res else 0,
-                    'stress_avg': n(res.get('averageStressLevel')) if res else 0,
-                    'timestamp': time.time()
-                }
-            elif metric == 'activities':
-                dt = datetime.strptime(date_str, '%Y-%m-%d').date()
-                s_api = (dt - timedelta(days=1)).isoformat()
-                e_api = (dt + timedelta(days=1)).isoformat()
-                raw_acts = self.client.get_activities_by_date(s_api, e_api)
-                data = []
-                for a in raw_acts:
-                    sl = a.get('startTimeLocal')
-                    if sl and sl.startswith(date_str):
-                        data.append(a)
-            elif metric == 'steps':
-                # get_daily_steps returns a list of days, we pick the one matching date_str
-                res = self.client.get_daily_steps(date_str, date_str)
-                data = res[0] if res else {'totalSteps': 0, 'stepGoal': 10000}
-                data['timestamp'] = time.time()
-            elif metric == 'weight':
-                res = self.client.get_body_composition(date_str)
-                data = res.get('totalAverage', {}) if res else {}
-                data['timestamp'] = time.time()
-            elif metric == 'sleep':
-                res = self.client.get_sleep_data(date_str)
-                data = res.get('dailySleepDTO', {}) if res else {}
-                data['timestamp'] = time.time()
-            elif metric == 'hrv':
-                res = self.client.get_hrv_data(date_str)
-                data = res.get('hrvSummary', {}) if res else {}
-                data['timestamp'] = time.time()
-            elif metric == 'stress':
-                res = self.client.get_stress_data(date_str)
-                data = {
-                    'avg': n(res.get('avgStressLevel')) if res else 0,
-                    'max': n(res.get('maxStressLevel')) if res else 0,
-                    'timestamp': time.time()
-                }
-            elif metric == 'intensity_minutes':
-                res = self.client.get_intensity_minutes_data(date_str)
-                data = {
-                    'moderate': n(res.get('moderateMinutes')) if res else 0,
-                    'vigorous': n(res.get('vigorousMinutes')) if res else 0,
-                    'total': (n(res.get('moderateMinutes')) + 2 * n(res.get('vigorousMinutes'))) if res else 0,
-                    'goal': n(res.get('weekGoal')) if res else 150,
-                    'timestamp': time.time()
-                }
-            elif metric == 'hr':
-                res = self.client.get_heart_rates(date_str)
-                data = res if res else {}
-                data['timestamp'] = time.time()
-            elif metric == 'hydration':
-                res = self.client.get_hydration_data(date_str)
-                data = {
-                    'intake': n(res.get('valueInML')) if res else 0,
-                    'goal': n(res.get('goalInML')) if res else 2000,
-                    'timestamp': time.time()
-                }
-            else:
+            data = garmin_request(self._fetch_metric, metric, date_str)
+            if data is None:
                 return None
 
             month_data[date_str] = data
@@ -589,6 +1138,91 @@ class GarminSyncManager:
             logger.error(f"Sync failed for {metric} on {date_str}: {e}")
             return month_data.get(date_str)
 
+    def _fetch_metric(self, metric, date_str):
+        """Fetch and normalize one day of a metric from the API, without touching the cache."""
+        if metric == 'stats':
+            res = self.client.get_stats(date_str)
+            
+            # Robust Max HR fetching
+            max_v = n(res.get('maxHeartRate')) if res else 0
+            rhr_v = n(res.get('restingHeartRate')) if res else 0
+            
+            if not max_v or not rhr_v:
+                # Fallback to detailed heart rate for missing extremes
+                hr_det = self.client.get_heart_rates(date_str) or {}
+                if not max_v: max_v = hr_det.get('maxHeartRate') or 0
+                if not rhr_v: rhr_v = hr_det.get('sleepingRestingHeartRate') or hr_det.get('restingHeartRate') or 0
+
+            data = {
+                'total': n(res.get('totalKilocalories') or res.get('totalCalories')) if res else 0,
+                'active': n(res.get('activeKilocalories') or res.get('activeCalories')) if res else 0,
+                'resting': n(res.get('bmrKilocalories') or res.get('bmrCalories') or res.get('restingCalories')) if res else 0,
+                'steps': n(res.get('totalSteps')) if res else 0,
+                'steps_goal': n(res.get('totalStepsGoal')) if res else 10000,
+                'resting_hr': rhr_v,
+                'max_hr': max_v,
+                'min_hr': n(res.get('minHeartRate')) if res else 0,
+                'stress_avg': n(res.get('averageStressLevel')) if res else 0,
+                'timestamp': time.time()
+            }
+        elif metric == 'activities':
+            dt = datetime.strptime(date_str, '%Y-%m-%d').date()
+            s_api = (dt - timedelta(days=1)).isoformat()
+            e_api = (dt + timedelta(days=1)).isoformat()
+            raw_acts = self.client.get_activities_by_date(s_api, e_api)
+            data = []
+            for a in raw_acts:
+                sl = a.get('startTimeLocal')
+                if sl and sl.startswith(date_str):
+                    data.append(a)
+        elif metric == 'steps':
+            # get_daily_steps returns a list of days, we pick the one matching date_str
+            res = self.client.get_daily_steps(date_str, date_str)
+            data = res[0] if res else {'totalSteps': 0, 'stepGoal': 10000}
+            data['timestamp'] = time.time()
+        elif metric == 'weight':
+            res = self.client.get_body_composition(date_str)
+            data = res.get('totalAverage', {}) if res else {}
+            data['timestamp'] = time.time()
+        elif metric == 'sleep':
+            res = self.client.get_sleep_data(date_str)
+            data = res.get('dailySleepDTO', {}) if res else {}
+            data['timestamp'] = time.time()
+        elif metric == 'hrv':
+            res = self.client.get_hrv_data(date_str)
+            data = res.get('hrvSummary', {}) if res else {}
+            data['timestamp'] = time.time()
+        elif metric == 'stress':
+            res = self.client.get_stress_data(date_str)
+            data = {
+                'avg': n(res.get('avgStressLevel')) if res else 0,
+                'max': n(res.get('maxStressLevel')) if res else 0,
+                'timestamp': time.time()
+            }
+        elif metric == 'intensity_minutes':
+            res = self.client.get_intensity_minutes_data(date_str)
+            data = {
+                'moderate': n(res.get('moderateMinutes')) if res else 0,
+                'vigorous': n(res.get('vigorousMinutes')) if res else 0,
+                'total': (n(res.get('moderateMinutes')) + 2 * n(res.get('vigorousMinutes'))) if res else 0,
+                'goal': n(res.get('weekGoal')) if res else 150,
+                'timestamp': time.time()
+            }
+        elif metric == 'hr':
+            res = self.client.get_heart_rates(date_str)
+            data = res if res else {}
+            data['timestamp'] = time.time()
+        elif metric == 'hydration':
+            res = self.client.get_hydration_data(date_str)
+            data = {
+                'intake': n(res.get('valueInML')) if res else 0,
+                'goal': n(res.get('goalInML')) if res else 2000,
+                'timestamp': time.time()
+            }
+        else:
+            return None
+        return data
+
     def _sync_activities_range(self, start_date, end_date):
         logger.info(f"Batch syncing activities from {start_date} to {end_date}...")
         try:
@@ -646,21 +1280,69 @@ class GarminSyncManager:
         except Exception as e:
             logger.error(f"Batch sync weight failed: {e}")
 
+    def _sync_daily_range(self, metric, ranges):
+        """Garmin has no range endpoint for DAILY_ONLY_METRICS, so fetch the days of every
+        (start, end) gap in one concurrent fan-out and write each month file once.
+        Returns the date strings that were fetched and written."""
+        date_strs = [
+            (rs + timedelta(days=i)).isoformat()
+            for rs, re in ranges
+            for i in range((re - rs).days + 1)
+        ]
+        logger.info(f"Batch syncing {metric}: {len(date_strs)} days across {len(ranges)} gaps...")
+
+        def fetch(d_str):
+            try:
+                return d_str, garmin_request(self._fetch_metric, metric, d_str)
+            except Exception as e:
+                # Leave the day missing; get_metric_for_date retries it individually
+                logger.warning(f"Batch sync {metric} failed for {d_str}: {e}")
+                return d_str, None
+
+        by_month = {}
+        for d_str, data in garmin_http_pool.map(fetch, date_strs):
+            if data is not None:
+                by_month.setdefault(d_str[:7], {})[d_str] = data
+
+        synced = set()
+        for days in by_month.values():
+            any_day = next(iter(days))
+            month_data = GarminPersistence.load_month(metric, any_day)
+            month_data.update(days)
+            GarminPersistence.save_month(metric, any_day, month_data)
+            now = time.time()
+            for d_str in days:
+                self.sync_times[f"{metric}_{d_str}"] = now
+            synced.update(days)
+        # Drop per-day memo entries the fresh month data supersedes
+        with self.day_cache_lock:
+            for d_str in synced:
+                self.day_cache.pop((metric, d_str), None)
+        return synced
+
     def get_range(self, metric, start_date, end_date, force_refresh=False):
         """Fetch a range of data, using cache where possible and batch fetching for gaps."""
         missing_ranges = []
-        current = start_date
         range_start = None
-        
-        while current <= end_date:
-            d_str = current.isoformat()
-            month_data = GarminPersistence.load_month(metric, d_str)
+        today = get_today()
+        # ISO strings for the whole range, built once and shared by the scan and collect passes
+        all_dates = [start_date + timedelta(days=i) for i in range((end_date - start_date).days + 1)]
+        iso_dates = [d.isoformat() for d in all_dates]
+        # Month files are the local store; parse each one once per pass rather than once per day
+        months = {}
+        def month_for(d_str):
+            key = d_str[:7]
+            if key not in months:
+                months[key] = GarminPersistence.load_month(metric, d_str)
+            return months[key]
+        
+        for current, d_str in zip(all_dates, iso_dates):
+            month_data = month_for(d_str)
             
-            is_today = (d_str == get_today().isoformat())
+            is_today = (current == today)
             is_missing = force_refresh or d_str not in month_data
             if not force_refresh and d_str in month_data:
                 cached = month_data[d_str]
-                today = get_today()
                 age = (today - current).days
                 is_near_past = age <= 3 and age >= 0
                 expiry = 3600 if is_today else 86400 if is_near_past else None
@@ -688,12 +1370,12 @@ class GarminSyncManager:
                 if range_start is not None:
                     missing_ranges.append((range_start, current - timedelta(days=1)))
                     range_start = None
-            current += timedelta(days=1)
             
         if range_start is not None:
             missing_ranges.append((range_start, end_date))
 
         # Batch fetch missing ranges
+        synced = set() # Days _sync_daily_range just fetched and wrote
         if missing_ranges:
             if metric == 'activities':
                 for rs, re in missing_ranges:
@@ -704,19 +1386,29 @@ class GarminSyncManager:
             elif metric == 'weight':
                 for rs, re in missing_ranges:
                     self._sync_weight_range(rs, re)
+            elif metric in DAILY_ONLY_METRICS:
+                # All gaps share one fan-out, so scattered stale days don't serialize behind each other
+                synced = self._sync_daily_range(metric, missing_ranges)
 
         # Collect results
+        # Batch syncs above rewrote month files, so reload before collecting
+        months.clear()
+        # A forced refresh already went through the batch sync for every batched metric; forcing
+        # again here would re-fetch each day one by one
+        batched = metric in ('activities', 'steps', 'weight') or metric in DAILY_ONLY_METRICS
+        collect_force = force_refresh and not batched
         results = []
-        current = start_date
-        while current <= end_date:
-            d_str = current.isoformat()
-            val = self.get_metric_for_date(metric, d_str, force_refresh=force_refresh)
+        for d_str in iso_dates:
+            month_data = month_for(d_str)
+            if d_str in synced:
+                val = month_data.get(d_str) # Just written, read it straight back
+            else:
+                val = self.get_metric_for_date(metric, d_str, force_refresh=collect_force, month_data=month_data)
             if val is not None:
                 if isinstance(val, dict):
                     results.append({**val, 'date': d_str, 'calendarDate': d_str})
                 else:
                     results.extend(val)
-            current += timedelta(days=1)
         logger.info(f"get_range: {metric} from {start_date} to {end_date} returned {len(results)} items")
         return results
 
@@ -740,21 +1432,23 @@ AI_MEMORY_FILE = 'ai_memory_cache.json'
 def load_ai_memory():
     try:
         if os.path.exists(AI_MEMORY_FILE):
-            with open(AI_MEMORY_FILE, 'r') as f:
-                return json.load(f)
+            with open(AI_MEMORY_FILE, 'rb') as f:
+                return orjson.loads(f.read())
     except:
         pass
     return {'activity_summaries': {}, 'last_health_state': {}}
 
 def save_ai_memory(memory):
     try:
-        with open(AI_MEMORY_FILE, 'w') as f:
-            json.dump(memory, f)
+        with open(AI_MEMORY_FILE, 'wb') as f:
+            f.write(orjson.dumps(memory, option=ORJSON_OPTS))
     except:
         pass
 
 # Initialize Cache
 poly_cache = PolylineCache()
+compact_food_logs()
+
 ai_memory = load_ai_memory()
 
 def group_activities_into_sessions(activities, hours_gap=2):
@@ -782,7 +1476,7 @@ def group_activities_into_sessions(activities, hours_gap=2):
             
         try:
             # Garmin format is usually YYYY-MM-DD HH:MM:SS
-            start_dt = datetime.strptime(start_str, '%Y-%m-%d %H:%M:%S')
+            start_dt = parse_garmin_datetime(start_str)
         except:
             start_dt = None
             
@@ -804,10 +1498,29 @@ def group_activities_into_sessions(activities, hours_gap=2):
     return sessions
 
 # Global state for background fetch management
-fetch_generation = 0
-active_fetch_range = None
-is_fetching = False
+# Each range (and the warmup prefetch) has its own generation, so fetchers for different ranges
+# run side by side and a new generation only supersedes the older one for the same range
+fetch_generation = 0 # Last generation id handed out, unique across ranges
+fetch_ranges = {} # range_key -> {'gen': generation_id, 'fetching': bool}
 fetch_lock = threading.Lock()
+fetch_cancel_events = {} # generation_id -> threading.Event, set when that generation is superseded
+
+def begin_fetch_generation(range_key):
+    """Start a new polyline fetch generation for range_key and signal its previous one to stop. Caller holds fetch_lock."""
+    global fetch_generation
+    state = fetch_ranges.get(range_key)
+    if state:
+        prev_evt = fetch_cancel_events.pop(state['gen'], None)
+        if prev_evt: prev_evt.set()
+    fetch_generation += 1
+    fetch_ranges[range_key] = {'gen': fetch_generation, 'fetching': True}
+    fetch_cancel_events[fetch_generation] = threading.Event()
+    return fetch_generation
+
+def is_current_fetch(range_key, generation_id):
+    """True while generation_id is still the newest fetch for range_key. Caller holds fetch_lock."""
+    state = fetch_ranges.get(range_key)
+    return bool(state) and state['gen'] == generation_id
 
 # AI Insights Cache (Persistent & In-Memory)
 AI_CACHE_EXPIRY = 21600 # 6 Hours
@@ -831,14 +1544,133 @@ heatmap_cache = {
 }
 HEATMAP_CACHE_EXPIRY = 120  # 2 minute cache duration (used when all routes loaded)
 HEATMAP_CACHE_EXPIRY_SYNCING = 10  # 10 second cache during active syncing
+def _last_month_range(today):
+    end_date = date(today.year, today.month, 1) - timedelta(days=1)
+    return date(end_date.year, end_date.month, 1), end_date
+
+# /api/heatmap_data ?range= -> (start, end) for a given today; anything else is the last 90 days
+HEATMAP_RANGES = {
+    'this_year': lambda today: (date(today.year, 1, 1), today),
+    'this_month': lambda today: (date(today.year, today.month, 1), today),
+    'last_month': _last_month_range,
+    'last_year': lambda today: (date(today.year - 1, 1, 1), date(today.year - 1, 12, 31)),
+    'all': lambda today: (date(2010, 1, 1), today), # Start from 2010 per user request
+}
+
+@lru_cache(maxsize=16)
+def resolve_heatmap_range(range_val, today):
+    resolver = HEATMAP_RANGES.get(range_val)
+    return resolver(today) if resolver else (today - timedelta(days=90), today)
+
+# Encoded bodies of the two heatmap caches, so cache hits skip re-serialization (see cached_json_response)
+heatmap_json_memo = {}
+activity_heatmap_json_memo = {}
+
+def cached_json_response(memo, key, data):
+    """jsonify(data), reusing the encoded body stored in memo while key (e.g. the cache timestamp) is unchanged."""
+    entry = memo.get('entry')
+    if entry is None or entry[0] != key:
+        # Same options and default hook as app.json.response, so a memoized body matches jsonify byte for byte
+        entry = (key, orjson.dumps(data, option=RESPONSE_ORJSON_OPTS, default=app.json.default))
+        memo['entry'] = entry
+    return app.response_class(entry[1], mimetype=app.json.mimetype)
 
 # Activity Heatmap Cache (Persisted)
 ACT_HEATMAP_CACHE_EXPIRY = 86400 # 24 Hours
+# Each day is stored column-wise ({'name': [...], 'type': [...], 'dist': [...], 'dur': [...]})
+# rather than as a list of per-activity dicts; calendar.js zips the columns back up
+ACT_HEATMAP_COLUMNS = ('name', 'type', 'dist', 'dur')
+MM_PER_TENTH_MILE = 160934 # 0.1 mi = 160.934 m
+
+def heatmap_minutes(raw_dur):
+    """Duration in whole minutes, rounded with round() like every other duration in the app."""
+    return round(raw_dur / 60) if raw_dur else 0
+
+def heatmap_day_columns(day):
+    """Return a heatmap day in column form, converting the older list-of-dicts layout."""
+    if isinstance(day, dict):
+        return day
+    return {col: [a.get(col) for a in day] for col in ACT_HEATMAP_COLUMNS}
+
 _cached_heatmap = GarminPersistence.get_singleton("activity_heatmap")
+if _cached_heatmap and _cached_heatmap.get('data'):
+    _cached_heatmap['data'] = {d: heatmap_day_columns(v) for d, v in _cached_heatmap['data'].items()}
 activity_heatmap_cache = _cached_heatmap if _cached_heatmap else {
     'data': None,
     'timestamp': None
 }
+# Caches younger than this are topped up with a delta fetch; older ones get the full 366-day rebuild
+ACT_HEATMAP_DELTA_MAX_AGE = 172800 # 48 Hours
+# Count-based fallback pages newest-first and stops at the window start (10 x 100 = the old 1000 cap)
+ACT_HEATMAP_FALLBACK_PAGE = 100
+ACT_HEATMAP_FALLBACK_MAX_PAGES = 10
+
+def fetch_activities_since(client, from_str):
+    """Page client.get_activities (newest first) until a page reaches back past from_str."""
+    activities = []
+    for page in range(ACT_HEATMAP_FALLBACK_MAX_PAGES):
+        batch = garmin_request(client.get_activities, page * ACT_HEATMAP_FALLBACK_PAGE, ACT_HEATMAP_FALLBACK_PAGE)
+        if not batch:
+            break
+        activities.extend(a for a in batch if a and (a.get('startTimeLocal') or '')[:10] >= from_str)
+        oldest = (batch[-1] or {}).get('startTimeLocal') or ''
+        if len(batch) < ACT_HEATMAP_FALLBACK_PAGE or oldest[:10] < from_str:
+            break
+    return activities
+
+def refresh_activity_heatmap(client):
+    """Bring activity_heatmap_cache up to date and persist it; returns the activities fetched.
+
+    Within ACT_HEATMAP_DELTA_MAX_AGE only the days since the last fetch are re-queried and their
+    date buckets replaced, instead of re-pulling and re-bucketing the whole year.
+    """
+    global activity_heatmap_cache
+    now = time.time()
+    today = get_today()
+    start_str = (today - timedelta(days=366)).isoformat()
+    end_str = today.isoformat()
+    
+    cached = activity_heatmap_cache
+    last_fetch = cached.get('last_fetch_date')
+    is_delta = bool(cached.get('data') is not None and last_fetch and now - (cached.get('timestamp') or 0) < ACT_HEATMAP_DELTA_MAX_AGE)
+    # Re-query the last fetched day too, activities often sync to Garmin hours after they happen
+    from_str = max(start_str, (date.fromisoformat(last_fetch) - timedelta(days=1)).isoformat()) if is_delta else start_str
+    logger.info(f"Heatmap: {'Delta' if is_delta else 'Full'} fetch from {from_str} to {end_str}")
+    
+    activities = []
+    fetch_failed = False
+    try:
+        activities = garmin_request(client.get_activities_by_date, from_str, end_str)
+    except Exception as e:
+        fetch_failed = True
+        logger.warning(f"Heatmap: get_activities_by_date failed: {e}. Falling back...")
+
+    # Fallback to count-based fetch if it failed (or a full fetch came back empty)
+    if fetch_failed or (not activities and not is_delta):
+        logger.info(f"Heatmap: No activities from date-range. Paging recent activities back to {from_str}...")
+        activities = fetch_activities_since(client, from_str)
+    activities = activities or []
+    logger.info(f"Heatmap: Found {len(activities)} activities to process.")
+    
+    # Keep untouched days inside the window, then rebuild every re-queried day from the fetch
+    heatmap = {d: v for d, v in cached['data'].items() if start_str <= d < from_str} if is_delta else {}
+    # Robust date extraction: first 10 characters of startTimeLocal are YYYY-MM-DD; screen once up front
+    dated = [(a, d) for a in activities if a and len(d := (a.get('startTimeLocal') or '')[:10]) == 10 and d >= from_str]
+    for activity, date_str in dated:
+        # Add a succinct summary for the UI tooltip
+        day = heatmap.get(date_str)
+        if day is None:
+            day = heatmap[date_str] = {col: [] for col in ACT_HEATMAP_COLUMNS}
+        day['name'].append(activity.get('activityName', 'Activity'))
+        day['type'].append(type_key_of(activity))
+        # Integer rounding: meters -> tenths of a mile via whole millimeters
+        raw_dist = activity.get('distance')
+        day['dist'].append((int(raw_dist * 1000) + MM_PER_TENTH_MILE // 2) // MM_PER_TENTH_MILE / 10 if raw_dist else 0)
+        day['dur'].append(heatmap_minutes(activity.get('duration')))
+    
+    activity_heatmap_cache = {'data': heatmap, 'timestamp': now, 'last_fetch_date': end_str}
+    GarminPersistence.save_singleton("activity_heatmap", activity_heatmap_cache)
+    return activities
 
 # Background Worker
 def server_warmup():
@@ -849,6 +1681,13 @@ def server_warmup():
     # Random wait between 2-15 seconds
     time.sleep(random.uniform(2.0, 15.0))
     
+    # First login happens here, after the jitter, so workers don't authenticate at the same instant;
+    # a worker that skips the warmup below still has a ready client for its first request
+    try:
+        get_garmin_client()
+    except Exception as e:
+        logger.warning(f"Server Warmup: Garmin login failed: {e}")
+    
     lock_file = os.path.join(GarminPersistence.BASE_DIR, "warmup.lock")
     os.makedirs(GarminPersistence.BASE_DIR, exist_ok=True)
     
@@ -883,35 +1722,19 @@ def server_warmup():
         # Check if disk cache is expired or missing
         is_heatmap_expired = not activity_heatmap_cache['data'] or (now - (activity_heatmap_cache.get('timestamp') or 0) > ACT_HEATMAP_CACHE_EXPIRY)
         
-        if is_heatmap_expired:
-            logger.info("Server Warmup: Activity heatmap cache empty/expired. Fetching 1 year of metadata...")
-            today = get_today()
-            start_date = today - timedelta(days=366)
-            activities = mgr.client.get_activities_by_date(start_date.isoformat(), today.isoformat()) if mgr.client else []
-            
-            heatmap = {}
-            for activity in activities:
-                if not activity: continue
-                # Extract date and basic stats without loading full activity details
-                start_local = activity.get('startTimeLocal')
-                if start_local and len(start_local) >= 10:
-                    date_str = start_local[:10]
-                    if date_str not in heatmap:
-                        heatmap[date_str] = []
-                    
-                    dist_mi = round(n(activity.get('distance')) / 1609.34, 1)
-                    dur_m = round(n(activity.get('duration')) / 60)
-                    
-                    heatmap[date_str].append({
-                        'name': activity.get('activityName', 'Activity'),
-                        'type': activity.get('activityType', {}).get('typeKey', 'other'),
-                        'dist': dist_mi,
-                        'dur': dur_m
-                    })
-            activity_heatmap_cache = {'data': heatmap, 'timestamp': now}
-            GarminPersistence.save_singleton("activity_heatmap", activity_heatmap_cache)
+        if is_heatmap_expired and mgr.client:
+            logger.info("Server Warmup: Activity heatmap cache empty/expired. Refreshing activity metadata...")
+            activities = refresh_activity_heatmap(mgr.client)
             logger.info("Server Warmup: Activity heatmap persisted to disk.")
-        else:
+
+            # Reuse the same activity list to prefetch map polylines while AI insights generate
+            activity_ids = [a['activityId'] for a in activities if a and a.get('activityId')]
+            if activity_ids and mgr.client:
+                with fetch_lock:
+                    current_gen = begin_fetch_generation('warmup') # Supersedes any earlier warmup fetch
+                logger.info(f"Server Warmup: Prefetching polylines gen:{current_gen} for {len(activity_ids)} activities.")
+                polyline_fetch_pool.submit(background_polyline_fetcher, mgr.client, activity_ids, 'warmup', current_gen)
+        elif not is_heatmap_expired:
             logger.info(f"Server Warmup: Activity heatmap is fresh ({round((now - activity_heatmap_cache['timestamp']) / 3600, 1)}h old). Skipping.")
 
         # Trigger AI Insight Generation in background only if no fresh cache exists
@@ -947,31 +1770,57 @@ if os.environ.get('WERKZEUG_RUN_MAIN') == 'true' or not app.debug:
     threading.Thread(target=server_warmup, daemon=True).start()
 
 # Background Worker for polylines
-def background_polyline_fetcher(client, activity_ids, generation_id):
+# Per job: with POLYLINE_FETCH_JOBS running together they hold at most 6 of the GARMIN_MAX_CONCURRENCY
+# slots, so interactive requests (activity view, stats) still get a slot
+POLYLINE_FETCH_WORKERS = (GARMIN_MAX_CONCURRENCY - 2) // POLYLINE_FETCH_JOBS
+polyline_inflight = set() # Activity ids some fetcher job has claimed; guarded by fetch_lock
+
+def background_polyline_fetcher(client, activity_ids, range_key, generation_id):
     """Fetch polylines for given IDs in background using parallel threads."""
-    global is_fetching
-    
-    logger.info(f"Background fetch gen:{generation_id} started for {len(activity_ids)} items using parallel threads.")
+    logger.info(f"Background fetch '{range_key}' gen:{generation_id} started for {len(activity_ids)} items using parallel threads.")
     count = 0
     
+    with fetch_lock:
+        cancel_evt = fetch_cancel_events.setdefault(generation_id, threading.Event())
+        if not is_current_fetch(range_key, generation_id):
+            cancel_evt.set() # Superseded before we even started
+    
+    claimed = set() # This job's ids in polyline_inflight
+    def release(aids):
+        with fetch_lock:
+            polyline_inflight.difference_update(aids)
+            claimed.difference_update(aids)
+    
+    def finish():
+        with fetch_lock:
+            if is_current_fetch(range_key, generation_id):
+                fetch_ranges[range_key]['fetching'] = False
+                fetch_cancel_events.pop(generation_id, None)
+                return True
+        return False
+    
     # Helper to fetch a single item
     def fetch_item(aid):
-        # Quick check inside thread (though outer loop handles most)
-        if generation_id != fetch_generation: return None
+        # Checked before and after the network call so superseded generations stop promptly
+        if cancel_evt.is_set(): return None
+        # Overlapping ranges share activities: skip ids another job has cached or is fetching right now
+        with fetch_lock:
+            if aid in polyline_inflight or poly_cache.has(aid): return None
+            polyline_inflight.add(aid)
+            claimed.add(aid)
         
         try:
-            details = client.get_activity_details(aid)
+            details = get_details_cached(client, aid, store=False) or {}
+            if cancel_evt.is_set(): return None
             poly = (details.get('geoPolylineDTO') or {}).get('polyline', [])
             if not poly:
                 return (aid, [])
             
-            # Optimize: Convert to compact [[lat, lon]] format and downsample
-            compact = [[p['lat'], p['lon']] for p in poly if 'lat' in p and 'lon' in p]
-            
-            # Downsample for heatmap (500 pts is plenty of resolution for a map line)
-            if len(compact) > 500:
-                step = len(compact) // 500
-                compact = compact[::step]
+            # Simplify for the heatmap: Douglas-Peucker keeps the turns and drops near-straight runs,
+            # then a stride caps anything still over POLY_MAX_POINTS
+            compact = simplify_polyline([[p['lat'], p['lon']] for p in poly if 'lat' in p and 'lon' in p])
+            if len(compact) > POLY_MAX_POINTS:
+                compact = compact[::len(compact) // POLY_MAX_POINTS]
                 
             return (aid, compact)
         except Exception as e:
@@ -979,18 +1828,22 @@ def background_polyline_fetcher(client, activity_ids, generation_id):
             logger.warning(f"Error fetching polyline for {aid}: {e}")
             return None
 
+    # Filter IDs that need fetching; a warm cache skips the pool (and the save) entirely
+    to_fetch = [aid for aid in activity_ids if not poly_cache.has(aid)]
+    if not to_fetch:
+        finish()
+        logger.info(f"Background fetch '{range_key}' gen:{generation_id} skipped, all polylines cached.")
+        return
+
     try:
-        # Use 3 workers for faster polyline fetching
-        with ThreadPoolExecutor(max_workers=3) as executor:
-            # Filter IDs that need fetching
-            to_fetch = [aid for aid in activity_ids if not poly_cache.has(aid)]
-            
+        # Polyline fetches are pure network wait, so overlap several per worker process
+        with ThreadPoolExecutor(max_workers=POLYLINE_FETCH_WORKERS) as executor:
             # Submit all
             future_to_aid = {executor.submit(fetch_item, aid): aid for aid in to_fetch}
             
             for future in as_completed(future_to_aid):
                 # Check cancellation
-                if generation_id != fetch_generation:
+                if cancel_evt.is_set():
                     logger.info("Fetch aborted by newer generation.")
                     executor.shutdown(wait=False, cancel_futures=True)
                     return
@@ -1002,14 +1855,15 @@ def background_polyline_fetcher(client, activity_ids, generation_id):
                     count += 1
                     
                     if count % 20 == 0:
-                        poly_cache.save()
-                        logger.info(f"Background fetch gen:{generation_id} progress: {count}")
+                        logger.info(f"Background fetch '{range_key}' gen:{generation_id} progress: {count}")
+                # Released only once cached, so another job can't slip in between
+                release((future_to_aid[future],))
 
     finally:
-        if generation_id == fetch_generation:
-            is_fetching = False
+        release(tuple(claimed))
+        if finish():
             poly_cache.save()
-            logger.info(f"Background fetch gen:{generation_id} completed. Updated {count} activities.")
+            logger.info(f"Background fetch '{range_key}' gen:{generation_id} completed. Updated {count} activities.")
 
 
 # Authentication Decorator
@@ -1135,10 +1989,12 @@ def refresh_cache():
             mgr.get_range(metric, start_date, end_date, force_refresh=True)
             
         # Invalidate memory-based summaries that might be affected
-        global activity_heatmap_cache, heatmap_cache, ai_insights_cache
+        global activity_heatmap_cache, heatmap_cache, ai_insights_cache, longterm_cache
         activity_heatmap_cache = {'data': None, 'timestamp': 0}
         heatmap_cache = {'data': None, 'timestamp': 0, 'range': None}
         ai_insights_cache = {'data': None, 'timestamp': 0}
+        longterm_cache = {'data': None, 'date': None, 'timestamp': 0}
+        ytd_year_cache.clear()
 
         return jsonify({'success': True, 'message': f'Successfully refreshed {len(metrics)} metrics from {start_str} to {end_str}.'})
     except Exception as e:
@@ -1255,6 +2111,23 @@ def get_ai_insights():
         logger.error(f"Error serving AI insights: {e}")
         return jsonify({'error': str(e)}), 500
 
+def round_floats(obj, ndigits=2):
+    """Recursively round floats in a JSON-like structure (shorter prompt, same meaning)."""
+    if isinstance(obj, float):
+        return round(obj, ndigits)
+    if isinstance(obj, dict):
+        return {k: round_floats(v, ndigits) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [round_floats(v, ndigits) for v in obj]
+    return obj
+
+def quantize_series(values, ndigits=2):
+    """Chart column for the wire: floats rounded and the trailing run of None dropped."""
+    end = len(values)
+    while end and values[end - 1] is None:
+        end -= 1
+    return [round(v, ndigits) if isinstance(v, float) else v for v in values[:end]]
+
 def generate_insights_logic():
     global ai_insights_cache, ai_memory
     
@@ -1290,9 +2163,11 @@ def generate_insights_logic():
                 aid = a.get('activityId')
                 if not aid: return a
                 
-                # Fetch both the full summary AND the second-by-second details via mgr client
-                full = mgr.client.get_activity(aid)
-                details = mgr.client.get_activity_details(aid)
+                # Fetch both the full summary AND the second-by-second details via mgr client (in parallel)
+                f_full = garmin_http_pool.submit(mgr.client.get_activity, aid)
+                f_details = garmin_http_pool.submit(get_details_cached, mgr.client, aid)
+                full = f_full.result()
+                details = f_details.result()
                 
                 if full: 
                     a.update(full)
@@ -1315,7 +2190,7 @@ def generate_insights_logic():
                             a['extracted_max_p'] = max(powers)
                 
                 # Fetch exercise sets for strength training
-                if a.get('activityType', {}).get('typeKey', '').lower() == 'strength_training':
+                if _activity_keys(a)[0] == 'strength_training':
                     ex_data = mgr.client.get_activity_exercise_sets(aid)
                     if ex_data and 'exerciseSets' in ex_data:
                         a['exercise_sets'] = ex_data['exerciseSets']
@@ -1377,11 +2252,7 @@ def generate_insights_logic():
 
         # ── 2. FOOD LOGS — loaded from local JSON file (not Garmin API) ──────────
         # Format: [{"date": "YYYY-MM-DD", name, calories, protein, carbs, ...}, ...]
-        raw_food_logs = load_json(FOOD_LOGS_FILE, []) if os.path.exists(FOOD_LOGS_FILE) else []
-        food_logs = {}
-        for entry in isinstance(raw_food_logs, list) and raw_food_logs or []:
-            if isinstance(entry, dict) and entry.get('date'):
-                food_logs.setdefault(entry['date'], []).append(entry)
+        food_logs = food_logs_by_date()
 
         today_log_entries = food_logs.get(today_str, [])
         today_nutrition = None
@@ -1420,16 +2291,20 @@ def generate_insights_logic():
         hydration_map = {s['date']: s for s in hist_hydration if 'date' in s}
         weight_map    = {s['date']: s for s in hist_weight   if 'date' in s}
 
+        # get_range batches the missing days and writes each month file once
+        past_dates = [(today - timedelta(days=i)).isoformat() for i in range(1, 8)]
+        hist_im    = mgr.get_range('intensity_minutes', today - timedelta(days=7), hist_end_30)
+        im_by_date = {s['date']: s for s in hist_im if 'date' in s}
+
         # Build the 7-day day-by-day history table (for the AI to spot trends)
         history_list_7d = []
-        for i in range(1, 8):
-            d_str = (today - timedelta(days=i)).isoformat()
+        for d_str in past_dates:
             s  = stats_map.get(d_str, {})
             sl = sleep_map.get(d_str, {})
             h  = hrv_map.get(d_str, {})
             hy = hydration_map.get(d_str, {})
             wt = weight_map.get(d_str, {})
-            im = mgr.get_metric_for_date('intensity_minutes', d_str) or {}
+            im = im_by_date.get(d_str, {})
             
             # Nutrition for this specific day from local logs
             entries = food_logs.get(d_str, [])
@@ -1512,6 +2387,8 @@ def generate_insights_logic():
         
         logger.info(f"AI Insights: Fetching activities since {fetch_start} via Sync Manager")
         acts_hist = mgr.get_range('activities', fetch_start, today)
+        for a in acts_hist:
+            normalize_activity(a)
         
         # Calculate Baselines (30d) and YTD Records
         baselines = {
@@ -1523,53 +2400,62 @@ def generate_insights_logic():
             'ytd_cycle_max_power_w': 0
         }
         
-        run_paces_min_per_mi = []
-        cycle_speeds_mph = []
-        cycle_powers = []
-        durations = []
+        # Running sums; run/cycle counts live in baselines
+        run_pace_sum = 0.0
+        cycle_speed_sum = 0.0
+        cycle_power_sum = 0.0
+        cycle_power_n = 0
+        duration_sum = 0.0
+        duration_n = 0
         
         for a in acts_hist:
             start_time_str = a.get('startTimeLocal', '')
             if not start_time_str: continue
             
             try:
-                act_date = datetime.strptime(start_time_str.split(' ')[0], '%Y-%m-%d').date()
+                act_date = date(int(start_time_str[0:4]), int(start_time_str[5:7]), int(start_time_str[8:10]))
             except:
                 continue
             
-            d_mi = n(a.get('distance', 0)) * 0.000621371
-            dur_m = n(a.get('duration', 0)) / 60
-            type_key = a.get('activityType', {}).get('typeKey', '')
+            d_mi = a['_dist'] * 0.000621371
+            dur_m = a['_dur'] / 60
+            type_key = a['_tk']
+            
+            # Classify once per activity; both sections below share the result
+            is_cycle = is_cycling_activity(a)
+            p = 0
+            if is_cycle:
+                summary = a.get('summaryDTO', {})
+                p = n(a.get('averagePower') or a.get('avgPower') or summary.get('averagePower') or summary.get('avgPower'))
             
             # YTD Records Tracking
             if act_date >= ytd_start:
                 if 'running' in type_key:
-                    baselines['ytd_run_max_dist_mi'] = max(baselines['ytd_run_max_dist_mi'], d_mi)
-                elif is_cycling_activity(a):
-                    baselines['ytd_cycle_max_dist_mi'] = max(baselines['ytd_cycle_max_dist_mi'], d_mi)
-                    summary = a.get('summaryDTO', {})
-                    p = a.get('averagePower') or a.get('avgPower') or summary.get('averagePower') or summary.get('avgPower')
-                    baselines['ytd_cycle_max_power_w'] = max(baselines['ytd_cycle_max_power_w'], n(p))
+                    if d_mi > baselines['ytd_run_max_dist_mi']: baselines['ytd_run_max_dist_mi'] = d_mi
+                elif is_cycle:
+                    if d_mi > baselines['ytd_cycle_max_dist_mi']: baselines['ytd_cycle_max_dist_mi'] = d_mi
+                    if p > baselines['ytd_cycle_max_power_w']: baselines['ytd_cycle_max_power_w'] = p
 
             # 30-Day Rolling Baseline
             if d_mi > 0 and dur_m > 0 and act_date >= baseline_start:
-                durations.append(dur_m)
+                duration_sum += dur_m
+                duration_n += 1
                 if is_running_activity(a):
                     baselines['run_count'] += 1
-                    run_paces_min_per_mi.append(dur_m / d_mi)
-                    baselines['run_max_dist_mi'] = max(baselines['run_max_dist_mi'], d_mi)
-                elif is_cycling_activity(a):
+                    run_pace_sum += dur_m / d_mi
+                    if d_mi > baselines['run_max_dist_mi']: baselines['run_max_dist_mi'] = d_mi
+                elif is_cycle:
                     baselines['cycle_count'] += 1
-                    baselines['cycle_max_dist_mi'] = max(baselines['cycle_max_dist_mi'], d_mi)
-                    cycle_speeds_mph.append(d_mi / (dur_m / 60))
-                    summary = a.get('summaryDTO', {})
-                    p = a.get('averagePower') or a.get('avgPower') or summary.get('averagePower') or summary.get('avgPower')
-                    if n(p) > 0: cycle_powers.append(p)
+                    if d_mi > baselines['cycle_max_dist_mi']: baselines['cycle_max_dist_mi'] = d_mi
+                    cycle_speed_sum += d_mi / (dur_m / 60)
+                    if p > 0:
+                        cycle_power_sum += p
+                        cycle_power_n += 1
         
-        if run_paces_min_per_mi: baselines['run_avg_pace_min_per_mi'] = sum(run_paces_min_per_mi) / len(run_paces_min_per_mi)
-        if cycle_speeds_mph: baselines['cycle_avg_speed_mph'] = sum(cycle_speeds_mph) / len(cycle_speeds_mph)
-        if cycle_powers: baselines['cycle_avg_power_w'] = sum(cycle_powers) / len(cycle_powers)
-        if durations: baselines['avg_activity_duration_min'] = sum(durations) / len(durations)
+        if baselines['run_count']: baselines['run_avg_pace_min_per_mi'] = run_pace_sum / baselines['run_count']
+        if baselines['cycle_count']: baselines['cycle_avg_speed_mph'] = cycle_speed_sum / baselines['cycle_count']
+        if cycle_power_n: baselines['cycle_avg_power_w'] = cycle_power_sum / cycle_power_n
+        if duration_n: baselines['avg_activity_duration_min'] = duration_sum / duration_n
 
         # ── 4. RECENT SESSIONS FOR DETAILED ANALYSIS ─────────────────────────────
         # acts_hist is chronological (oldest-to-newest). We take the last 15 (most recent).
@@ -1577,24 +2463,24 @@ def generate_insights_logic():
         
         # Enrichment: Fetch full activity objects for the most recent activities
         if acts_raw:
-            with ThreadPoolExecutor(max_workers=5) as executor:
-                acts_raw = list(executor.map(fetch_full_act, acts_raw))
+            acts_raw = list(request_pool.map(fetch_full_act, acts_raw))
 
         # Sort newest first so the AI sees today's workout at the top of the list
         acts_raw.sort(key=lambda x: x.get('startTimeLocal', ''), reverse=True)
         
         sessions = group_activities_into_sessions(acts_raw)
+        # Session ids are reused by every pass below (context, placeholders, final mapping)
+        session_ids = ["|".join(str(a.get('activityId')) for a in s) for s in sessions]
         
         # Summarize sessions for 'Today' (used to prioritize in Daily Summary)
         today_session_ids = []
-        for s in sessions:
+        for s, sid in zip(sessions, session_ids):
             if s[0].get('startTimeLocal', '').startswith(today_str):
-                today_session_ids.append("|".join([str(a.get('activityId')) for a in s]))
+                today_session_ids.append(sid)
         
         # 2. Memory-Based Context Reduction
         training_history_for_ai = []
-        for s in sessions:
-            session_id = "|".join([str(a.get('activityId')) for a in s])
+        for s, session_id in zip(sessions, session_ids):
             
             # Check if we already have a detailed summary for this session in memory
             if session_id in ai_memory['activity_summaries']:
@@ -1644,10 +2530,10 @@ def generate_insights_logic():
                             if n(max_p) > 0: stage_data["max_power_w"] = n(max_p)
                             if n(norm_p) > 0: stage_data["normalized_power_w"] = n(norm_p)
                             
-                            stage_data["is_virtual"] = "virtual" in a.get('activityType', {}).get('typeKey', '').lower() or "zwift" in a.get('activityName', '').lower()
+                            stage_data["is_virtual"] = "virtual" in a['_tk'] or "zwift" in a['_an']
                             
                     # Strength Data Processing
-                    if a.get('activityType', {}).get('typeKey', '').lower() == 'strength_training':
+                    if a['_tk'] == 'strength_training':
                         stage_data["type"] = "STRENGTH"
                         ex_sets = a.get('exercise_sets', [])
                         if ex_sets:
@@ -1767,7 +2653,7 @@ def generate_insights_logic():
         )
 
         # ── 6. GEMINI CALL WITH RETRY LOGIC ─────────────────────────────────────
-        ai_client  = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+        ai_client  = get_genai_client()
         settings   = load_settings()
         model_name = settings.get('ai_model', 'gemma-3-27b-it')
 
@@ -1816,7 +2702,7 @@ TONE:
 - Stress scale: 0-25=low/resting, 26-50=moderate, 51-75=high, 76+=very high.
 
 DATA:
-{json.dumps(context)}
+{orjson.dumps(round_floats(context), option=ORJSON_OPTS).decode()}
 
 ACTIVITY RULES:
 - Sessions with "cached_insight" already have an analysis — reuse it as-is.
@@ -1849,14 +2735,7 @@ Return ONLY valid JSON (no markdown block wrapper around it, but you MUST use HT
         
         # Robust JSON extraction
         try:
-            import re
-            json_match = re.search(r'\{.*\}', raw_text, re.DOTALL)
-            if json_match:
-                clean_text = json_match.group(0)
-            else:
-                clean_text = raw_text.replace('```json', '').replace('```', '').strip()
-            
-            ai_data = json.loads(clean_text)
+            ai_data = parse_ai_json_object(raw_text)
         except Exception as e:
             logger.error(f"Failed to parse AI response: {e}")
             logger.error(f"RAW TEXT: {raw_text}")
@@ -1871,8 +2750,7 @@ Return ONLY valid JSON (no markdown block wrapper around it, but you MUST use HT
         
         # Fallback Check: If the AI skipped ANY sessions, we create a basic placeholder 
         # so they aren't blank on the UI.
-        for s in sessions:
-            sid = "|".join([str(a.get('activityId')) for a in s])
+        for s, sid in zip(sessions, session_ids):
             if sid not in ai_memory['activity_summaries']:
                 logger.warning(f"AI skipped session {sid}, creating placeholder.")
                 ai_memory['activity_summaries'][sid] = {
@@ -1889,17 +2767,13 @@ Return ONLY valid JSON (no markdown block wrapper around it, but you MUST use HT
         # Build final response with unrolled activity IDs
         final_activity_insights = []
         # We iterate over the sessions we originally identified to ensure nothing is missed
-        for s in sessions:
-            sid = "|".join([str(a.get('activityId')) for a in s])
+        for s, sid in zip(sessions, session_ids):
             # Get insight from memory (which now includes the ones just generated)
             insight = ai_memory['activity_summaries'].get(sid)
             
             if insight:
                 # Map this session insight to every activity in the group
-                for a in s:
-                    unrolled = insight.copy()
-                    unrolled['activity_id'] = str(a.get('activityId'))
-                    final_activity_insights.append(unrolled)
+                final_activity_insights.extend({**insight, 'activity_id': str(a.get('activityId'))} for a in s)
 
         result = {
             'daily_summary':    ai_data.get('daily_summary'),
@@ -1944,10 +2818,18 @@ def get_stats():
         today_str = today.isoformat()
         logger.info(f"Dashboard Update: Fetching data for {today_str}")
         
+        # Every source below is an independent cache read / Garmin round trip, so issue them together
+        start_date = today - timedelta(days=7)
+        f_stats = request_pool.submit(mgr.get_metric_for_date, 'stats', today_str)
+        f_sleep = request_pool.submit(mgr.get_metric_for_date, 'sleep', today_str)
+        f_hrv = request_pool.submit(mgr.get_metric_for_date, 'hrv', today_str)
+        f_acts = request_pool.submit(mgr.get_range, 'activities', start_date, today)
+        f_weight = request_pool.submit(mgr.get_metric_for_date, 'weight', today_str)
+        
         # 1. Fetch Metrics via Persistent Sync Manager
-        cal_data = mgr.get_metric_for_date('stats', today_str) or {}
-        sleep_data = mgr.get_metric_for_date('sleep', today_str) or {}
-        hrv_data = mgr.get_metric_for_date('hrv', today_str) or {}
+        cal_data = f_stats.result() or {}
+        sleep_data = f_sleep.result() or {}
+        hrv_data = f_hrv.result() or {}
         
         # If offline mode and completely zero data for today, display yesterday's valid cache so the UI isn't empty
         if mgr.client is None and not cal_data.get('steps'):
@@ -1958,8 +2840,7 @@ def get_stats():
             hrv_data = mgr.get_metric_for_date('hrv', yesterday_str) or {}
         
         # 2. Recent activities (using last 7 days range for cache reliability)
-        start_date = today - timedelta(days=7)
-        acts_raw = mgr.get_range('activities', start_date, today)
+        acts_raw = f_acts.result()
         sessions = group_activities_into_sessions(acts_raw)
         
         # Flatten sessions for UI
@@ -1968,10 +2849,18 @@ def get_stats():
             if len(s) == 1:
                 ui_activities.append(s[0])
             else:
-                total_dist = sum(n(a.get('distance', 0)) for a in s)
-                total_dur = sum(n(a.get('duration', 0)) for a in s)
-                total_cals = sum(n(a.get('calories') or a.get('summaryDTO', {}).get('calories')) for a in s)
-                primary = max(s, key=lambda x: n(x.get('distance', 0))) if s else s[0]
+                # Single pass: totals plus the longest stage as the primary
+                total_dist = total_dur = total_cals = 0
+                primary = s[0]
+                best = -1
+                for a in s:
+                    d = n(a.get('distance', 0))
+                    total_dist += d
+                    total_dur += n(a.get('duration', 0))
+                    total_cals += n(a.get('calories') or a.get('summaryDTO', {}).get('calories'))
+                    if d > best:
+                        best = d
+                        primary = a
                 
                 grouped = primary.copy()
                 grouped['distance'] = total_dist
@@ -1983,19 +2872,13 @@ def get_stats():
                 grouped['grouped_activities'] = s
                 ui_activities.append(grouped)
 
-        # 3. Weight - Fetch from Sync Manager (it handles looking back for data)
-        # We try today, but if empty, mgr uses the specific lookup logic
-        weight_doc = mgr.get_metric_for_date('weight', today_str) or {}
-        weight_grams = weight_doc.get('weight', 0)
-        
-        # If today's weight is missing, let's look back 5 days specifically via manager
+        # 3. Weight - today first, then the most recent of the previous 5 days.
+        # The look-back goes through get_range, which writes the month file from one thread
+        # (parallel per-day lookups would each read-modify-write the same month).
+        weight_grams = (f_weight.result() or {}).get('weight') or 0
         if not weight_grams:
-            for i in range(1, 6):
-                prev_date = (today - timedelta(days=i)).isoformat()
-                prev_weight = mgr.get_metric_for_date('weight', prev_date) or {}
-                if prev_weight.get('weight'):
-                    weight_grams = prev_weight['weight']
-                    break
+            recent = mgr.get_range('weight', today - timedelta(days=5), today - timedelta(days=1))
+            weight_grams = next((w['weight'] for w in reversed(recent) if w.get('weight')), 0)
 
         response_data = {
             'offline_mode': mgr.client is None,
@@ -2063,10 +2946,14 @@ def get_goals_config():
 @app.route('/api/longterm_stats')
 @login_required
 def get_longterm_stats():
+    global longterm_cache
     try:
         mgr = get_sync_manager()
         today = get_today()
         
+        if longterm_cache['data'] and longterm_cache['date'] == today and time.time() - longterm_cache['timestamp'] < LONGTERM_CACHE_TTL:
+            return jsonify(longterm_cache['data'])
+        
         # Calculate start dates
         start_of_month = today.replace(day=1)
         start_of_year = today.replace(month=1, day=1)
@@ -2074,31 +2961,27 @@ def get_longterm_stats():
         # Fetch all activities from the cache for the entire year
         all_activities = mgr.get_range('activities', start_of_year, today)
         
-        def calculate_mileage(activities, start_date):
-            running = 0
-            cycling = 0
-            for a in activities:
-                # Filter by date
-                start_str = a.get('startTimeLocal', '')
-                if not start_str: continue
-                try:
-                    act_date = datetime.strptime(start_str.split(' ')[0], '%Y-%m-%d').date()
-                    if act_date < start_date: continue
-                except: continue
-                
-                dist_mi = n(a.get('distance', 0)) * 0.000621371
-                type_key = a.get('activityType', {}).get('typeKey', '').lower()
-                
-                if is_running_activity(a):
-                    running += dist_mi
-                elif is_cycling_activity(a):
-                    cycling += dist_mi
-            return running, cycling
-
-        month_run, month_cycle = calculate_mileage(all_activities, start_of_month)
-        year_run, year_cycle = calculate_mileage(all_activities, start_of_year)
-        
-        return jsonify({
+        # One pass: each activity is normalized and classified once, then counted toward year and month.
+        # ISO 'YYYY-MM-DD' prefixes compare correctly as strings, so no date parsing is needed.
+        month_str = start_of_month.isoformat()
+        year_str = start_of_year.isoformat()
+        month_run = month_cycle = year_run = year_cycle = 0
+        for a in all_activities:
+            day_str = a.get('startTimeLocal', '')[:10]
+            if len(day_str) < 10 or day_str < year_str: continue
+            
+            normalize_activity(a)
+            dist_mi = a['_dist'] * 0.000621371
+            in_month = day_str >= month_str
+            
+            if is_running_activity(a):
+                year_run += dist_mi
+                if in_month: month_run += dist_mi
+            elif is_cycling_activity(a):
+                year_cycle += dist_mi
+                if in_month: month_cycle += dist_mi
+        
+        data = {
             'month': {
                 'running': month_run,
                 'cycling': month_cycle
@@ -2107,7 +2990,9 @@ def get_longterm_stats():
                 'running': year_run,
                 'cycling': year_cycle
             }
-        })
+        }
+        longterm_cache = {'data': data, 'date': today, 'timestamp': time.time()}
+        return jsonify(data)
     except Exception as e:
         logger.error(f"Error fetching longterm stats: {e}")
         return jsonify({'error': str(e)}), 500
@@ -2127,19 +3012,24 @@ def get_ytd_mileage_comparison():
         # Years to compare (Current + Previous)
         target_years = [2024, 2025, 2026]
         
-        for year in target_years:
+        def cached_year(year):
+            entry = ytd_year_cache.get(year)
+            if not entry: return None
+            # Past years are final; the current year is reused for YTD_CACHE_TTL on the same day
+            if year < today.year: return entry
+            if entry['date'] == today and time.time() - entry['timestamp'] < YTD_CACHE_TTL: return entry
+            return None
+        
+        def fetch_year(year):
             # Target date range: Jan 1 to same day-of-year as today OR Dec 31 if year is past
             start_date = date(year, 1, 1)
-            end_of_year = date(year, 12, 31)
             
             # For current year, only fetch up to today
             if year == today.year:
                 end_fetch = today
             elif year > today.year:
                 # Placeholder for future years if applicable
-                cycling_daily_data[str(year)] = [0] * current_day_of_year
-                running_daily_data[str(year)] = [0] * current_day_of_year
-                continue
+                return year, None
             else:
                 # Past year - we actually only need the cumulative up to current_day_of_year for comparison
                 end_fetch = date(year, 12, 31)
@@ -2147,48 +3037,66 @@ def get_ytd_mileage_comparison():
             try:
                 logger.info(f"YTD Comparison: Processing year {year} via Sync Manager...")
                 # Get activities for the whole year (cached monthly)
-                activities = mgr.get_range('activities', start_date, end_fetch)
-                
-                day_map_cycle = {}
-                day_map_run = {}
+                return year, mgr.get_range('activities', start_date, end_fetch)
+            except Exception as e:
+                logger.error(f"Error fetching YTD for {year}: {e}")
+                return year, None
+        
+        years_to_fetch = []
+        for year in target_years:
+            entry = cached_year(year)
+            if entry:
+                cycling_daily_data[str(year)] = entry['cycling'][:current_day_of_year]
+                running_daily_data[str(year)] = entry['running'][:current_day_of_year]
+            else:
+                years_to_fetch.append(year)
+        
+        # Each year is an independent (mostly cached) range read, so fetch them side by side
+        year_results = []
+        if years_to_fetch:
+            year_results = list(request_pool.map(fetch_year, years_to_fetch))
+        
+        for year, activities in year_results:
+            if activities is None:
+                cycling_daily_data[str(year)] = [0] * current_day_of_year
+                running_daily_data[str(year)] = [0] * current_day_of_year
+                continue
+
+            try:
+                # Per-day meters indexed by day-of-year (slot 0 unused)
+                day_cycle = [0.0] * 367
+                day_run = [0.0] * 367
+                jan1_ordinal = date(year, 1, 1).toordinal()
                 
                 for act in activities:
                     start_local = act.get('startTimeLocal')
                     if not start_local: continue
                     
                     try:
-                        d_str = start_local.split(' ')[0]
-                        d = date.fromisoformat(d_str)
-                        if d.year != year: continue # Hygiene
-                        d_num = d.timetuple().tm_yday
+                        if int(start_local[0:4]) != year: continue # Hygiene
+                        d_num = date(year, int(start_local[5:7]), int(start_local[8:10])).toordinal() - jan1_ordinal + 1
                         
-                        dist_meters = n(act.get('distance', 0))
-                        type_key = act.get('activityType', {}).get('typeKey', '').lower()
+                        normalize_activity(act)
+                        dist_meters = act['_dist']
                         
                         # Cycling
                         if is_cycling_activity(act):
-                            day_map_cycle[d_num] = day_map_cycle.get(d_num, 0) + dist_meters
+                            day_cycle[d_num] += dist_meters
                         # Running
                         elif is_running_activity(act):
-                            day_map_run[d_num] = day_map_run.get(d_num, 0) + dist_meters
+                            day_run[d_num] += dist_meters
                     except: continue
 
-                # Build cumulative arrays up to current_day_of_year
-                cycle_cumulative = []
-                run_cumulative = []
-                cum_c_m = 0
-                cum_r_m = 0
-                
+                # Build cumulative arrays up to current_day_of_year (whole year for past years, so they can be cached)
                 M_TO_MI = 0.000621371
                 
-                for d in range(1, current_day_of_year + 1):
-                    cum_c_m += day_map_cycle.get(d, 0)
-                    cum_r_m += day_map_run.get(d, 0)
-                    cycle_cumulative.append(round(cum_c_m * M_TO_MI, 1))
-                    run_cumulative.append(round(cum_r_m * M_TO_MI, 1))
+                last_day = current_day_of_year if year == today.year else 366
+                cycle_cumulative = [round(m * M_TO_MI, 1) for m in accumulate(day_cycle[1:last_day + 1])]
+                run_cumulative = [round(m * M_TO_MI, 1) for m in accumulate(day_run[1:last_day + 1])]
                 
-                cycling_daily_data[str(year)] = cycle_cumulative
-                running_daily_data[str(year)] = run_cumulative
+                ytd_year_cache[year] = {'cycling': cycle_cumulative, 'running': run_cumulative, 'date': today, 'timestamp': time.time()}
+                cycling_daily_data[str(year)] = cycle_cumulative[:current_day_of_year]
+                running_daily_data[str(year)] = run_cumulative[:current_day_of_year]
 
             except Exception as e:
                 logger.error(f"Error processing YTD for {year}: {e}")
@@ -2244,7 +3152,6 @@ def get_steps_history():
         
         start_date = end_date - timedelta(days=history_days)
         all_data = mgr.get_range('steps', start_date, end_date)
-        all_data.sort(key=lambda x: x['calendarDate'], reverse=True)
         
         # Streak calculation (using 90 days of cache/sync)
         streak_start = actual_today - timedelta(days=90)
@@ -2274,8 +3181,10 @@ def get_steps_history():
         
         # Filter history to ensure we don't return data past the end_date if Garmin returns it
         # and specifically for 1d view, ensure we are actually returning the requested day
-        history = [d for d in all_data if d['calendarDate'] <= end_date.isoformat()]
-        history = list(reversed(history[:requested_days]))
+        # Only the newest requested_days are needed, so take a top-k instead of sorting everything
+        end_str = end_date.isoformat()
+        history = heapq.nlargest(requested_days, (d for d in all_data if d['calendarDate'] <= end_str), key=lambda x: x['calendarDate'])
+        history.reverse()
         
         # If we asked for 1d but history[0] isn't the right date, return an empty/zero placeholder
         if range_val == '1d' and history and history[0].get('calendarDate') != end_date.isoformat():
@@ -2489,12 +3398,13 @@ def get_calorie_history():
         
         dates_to_fetch = [end_date - timedelta(days=i) for i in range(days)]
         dates_to_fetch = sorted(dates_to_fetch)
+        iso_dates = [d.isoformat() for d in dates_to_fetch]
         
-        logs = load_json(FOOD_LOGS_FILE, [])
+        logs_by_date = food_logs_by_date()
         
         # Build daily nutrition sums
         def get_day_nutrition(d_str):
-            day_logs = [l for l in logs if l['date'] == d_str]
+            day_logs = logs_by_date.get(d_str, [])
             return {
                 'consumed': sum(l.get('calories', 0) for l in day_logs),
                 'cholesterol_mg': sum(l.get('cholesterol_mg', 0) for l in day_logs),
@@ -2519,10 +3429,7 @@ def get_calorie_history():
         except Exception as e:
             logger.warning(f"Weight fetch for calorie history: {e}")
         
-        from concurrent.futures import ThreadPoolExecutor
-        
-        def fetch_day(d):
-            d_str = d.isoformat()
+        def fetch_day(d_str):
             try:
                 cal_data = get_calorie_data(client, d_str)
                 nut = get_day_nutrition(d_str)
@@ -2561,8 +3468,7 @@ def get_calorie_history():
                     'weight_lbs': weight_by_date.get(d_str)
                 }
         
-        with ThreadPoolExecutor(max_workers=4) as executor:
-            history = list(executor.map(fetch_day, dates_to_fetch))
+        history = list(garmin_http_pool.map(fetch_day, iso_dates))
         
         return jsonify({'history': history, 'range': range_val})
     except Exception as e:
@@ -2593,18 +3499,18 @@ def get_weight_history():
         start_date = end_date - timedelta(days=days)
         history_raw = mgr.get_range('weight', start_date, end_date)
         
-        # Format for chart (earliest to latest)
-        history = []
-        for day in history_raw:
-            val = day.get('weight')
-            if val:
-                kg = val / 1000
-                lbs = kg * 2.20462
-                history.append({
-                    'date': day['date'],
-                    'weight_kg': round(kg, 1),
-                    'weight_lbs': round(lbs, 1)
-                })
+        # Format for chart (earliest to latest); grams -> kg / lbs in one multiply each
+        G_TO_KG = 0.001
+        G_TO_LBS = 0.001 * 2.20462
+        history = [
+            {
+                'date': day['date'],
+                'weight_kg': round(val * G_TO_KG, 1),
+                'weight_lbs': round(val * G_TO_LBS, 1)
+            }
+            for day in history_raw
+            if (val := day.get('weight'))
+        ]
         
         # Calculate summary stats
         summary = {}
@@ -2614,9 +3520,6 @@ def get_weight_history():
             summary['latest_kg'] = latest['weight_kg']
             summary['date'] = latest['date']
             
-            latest_dt = date.fromisoformat(latest['date'])
-            seven_days_ago = latest_dt - timedelta(days=7)
-            recent_points = [d['weight_lbs'] for d in history if date.fromisoformat(d['date']) > seven_days_ago]
             if len(history) > 7:
                 old = history[-8]
                 summary['delta_lbs'] = round(latest['weight_lbs'] - old['weight_lbs'], 1)
@@ -2767,7 +3670,14 @@ def get_intensity_minutes_history():
             weeks = 26 if range_val == '6m' else 52
             start_date = end_date - timedelta(weeks=weeks)
             
-            wim_data = mgr.client.get_weekly_intensity_minutes(start_date.isoformat(), end_date.isoformat())
+            # One batched weekly call covers the whole range; reuse it briefly since only the current week moves
+            cache_key = (start_date.isoformat(), end_date.isoformat())
+            cached = weekly_im_cache.get(cache_key)
+            if cached and time.time() - cached['timestamp'] < WEEKLY_IM_CACHE_TTL:
+                wim_data = cached['data']
+            else:
+                wim_data = garmin_request(mgr.client.get_weekly_intensity_minutes, *cache_key) or []
+                weekly_im_cache[cache_key] = {'data': wim_data, 'timestamp': time.time()}
             history = []
             for w in wim_data:
                 history.append({
@@ -2795,7 +3705,7 @@ def get_activity_details(activity_id):
     try:
         logger.info(f"Fetching details for activity_id: {activity_id}")
         client = get_garmin_client()
-        details = client.get_activity_details(activity_id)
+        details = get_details_cached(client, activity_id)
         if not details:
             logger.warning(f"No details found for activity {activity_id}")
             return jsonify({'error': "Activity details not available from Garmin"}), 404
@@ -2811,18 +3721,23 @@ def get_activity_details(activity_id):
         key_map = {d['key']: d['metricsIndex'] for d in descriptors}
         logger.info(f"Available metrics keys: {list(key_map.keys())}")
         
-        def get_val(row, key):
+        # Column-wise extraction: resolve each key's index once, then pull that slot from every row
+        rows = [m['metrics'] for m in metrics_list if m.get('metrics')]
+        def column(key):
             idx = key_map.get(key)
-            if idx is not None and idx < len(row):
-                return row[idx]
-            return None
+            if idx is None:
+                return [None] * len(rows)
+            return [r[idx] if idx < len(r) else None for r in rows]
 
         charts = {
             'heart_rate': [], 'speed': [], 'elevation': [],
             'cadence': [], 'power': [], 'timestamps': [], 'distance': []
         }
         
-        activity_info = client.get_activity(activity_id) or {}
+        activity_info = normalize_activity(client.get_activity(activity_id) or {})
+        type_key = activity_info['_tk']
+        # Comprehensive cycling check (Type or Name), done once for PBs and splits
+        is_cycling = is_cycling_activity(activity_info)
         
         # --- PB Tracking ---
         try:
@@ -2857,7 +3772,7 @@ def get_activity_details(activity_id):
             
             if needs_calc:
                 is_run = is_running_activity(activity_info)
-                is_bike = is_cycling_activity(activity_info)
+                is_bike = is_cycling
                 if is_run or is_bike:
                     pow_bests, pace_bests = pb_parse_activity_details(details)
                     pts[aid_str] = {
@@ -2879,33 +3794,26 @@ def get_activity_details(activity_id):
         summary = {}
         info_summary = activity_info.get('summaryDTO', {})
         
-        # Build strict chart lists
-        for m in metrics_list:
-            row = m.get('metrics')
-            if not row: continue
-            
-            ts = get_val(row, 'directTimestamp')
-            if ts:
-                charts['timestamps'].append(ts)
-                charts['heart_rate'].append(get_val(row, 'directHeartRate'))
-                charts['speed'].append(get_val(row, 'directSpeed'))
-                charts['elevation'].append(get_val(row, 'directElevation'))
-                charts['power'].append(get_val(row, 'directPower'))
-                charts['distance'].append(get_val(row, 'sumDistance'))
-                
-                # Cadence logic
-                cad = get_val(row, 'directRunCadence')
-                if cad is None: cad = get_val(row, 'directDoubleCadence')
-                if cad is None: cad = get_val(row, 'directBikeCadence')
-                if cad is None: cad = get_val(row, 'directFractionalCadence')
-                charts['cadence'].append(cad)
+        # Build strict chart lists (only rows with a timestamp)
+        ts_col = column('directTimestamp')
+        dist_col = column('sumDistance')
+        keep = [i for i, ts in enumerate(ts_col) if ts]
+        charts['timestamps'] = [ts_col[i] for i in keep]
+        charts['distance'] = [dist_col[i] for i in keep]
+        for chart_key, metric_key in (('heart_rate', 'directHeartRate'), ('speed', 'directSpeed'),
+                                      ('elevation', 'directElevation'), ('power', 'directPower')):
+            col = column(metric_key)
+            charts[chart_key] = [col[i] for i in keep]
+        
+        # Cadence logic: first non-null of the cadence variants
+        cad_cols = [column(k) for k in ('directRunCadence', 'directDoubleCadence', 'directBikeCadence', 'directFractionalCadence')]
+        charts['cadence'] = [next((c[i] for c in cad_cols if c[i] is not None), None) for i in keep]
+        # Sensor floats carry ~15 digits of noise; 2 decimals is plenty for plotting
+        for chart_key in ('heart_rate', 'speed', 'elevation', 'cadence', 'power', 'distance'):
+            charts[chart_key] = quantize_series(charts[chart_key])
 
 
         # Summary Refinement: Merge details summary with full activity summary
-        saved_bests = activity_info.get('activity_bests')
-        activity_info = client.get_activity(activity_id) or {}
-        if saved_bests:
-            activity_info['activity_bests'] = saved_bests
         summary = {}
         # Start with the full activity summary (usually has movingDuration, etc.)
         info_summary = activity_info.get('summaryDTO')
@@ -2943,15 +3851,6 @@ def get_activity_details(activity_id):
             pace_seconds = 1609.34 / avg_speed
             avg_pace_str = f"{int(pace_seconds//60)}:{int(pace_seconds%60):02d}"
 
-        # Determine activity type for splits/logic
-        type_info = (activity_info.get('activityType') or 
-                     activity_info.get('activityTypeDTO') or {})
-        type_key = type_info.get('typeKey', '').lower()
-        act_name = activity_info.get('activityName', '').lower() if activity_info else ""
-        
-        # Comprehensive cycling check (Type or Name)
-        is_cycling = is_cycling_activity(activity_info)
-        
         split_len = 5 if is_cycling else 1
         
         logger.info(f"Activity {activity_id} detected as {'CYCLING' if is_cycling else 'RUNNING/OTHER'} (type_key: {type_key})")
@@ -2966,40 +3865,39 @@ def get_activity_details(activity_id):
                 last_dist = 0
                 start_ts = charts['timestamps'][0] if charts['timestamps'] else 0
                 
-                for m in metrics_list:
-                    row = m.get('metrics')
-                    if not row: continue
+                dur_col = column('sumDuration')
+                # Running max of cumulative distance: the first row to reach each boundary is one bisect away
+                reach = list(accumulate((d or 0 for d in dist_col), max))
+                i = bisect_left(reach, next_split_dist)
+                while i < len(reach):
+                    curr_dist, curr_dur, ts = dist_col[i], dur_col[i], ts_col[i]
+                    # Find duration
+                    if curr_dur is None: # Fallback to timestamp
+                        curr_dur = (ts - start_ts) / 1000 if ts else 0
                     
-                    curr_dist = get_val(row, 'sumDistance')
-                    if curr_dist and curr_dist >= next_split_dist:
-                        # Find duration
-                        curr_dur = get_val(row, 'sumDuration')
-                        if curr_dur is None: # Fallback to timestamp
-                            ts = get_val(row, 'directTimestamp')
-                            curr_dur = (ts - start_ts) / 1000 if ts else 0
-                        
-                        split_dur = curr_dur - last_dur
-                        actual_dist_m = curr_dist - last_dist
-                        actual_dist_mi = actual_dist_m / mile_in_m
-                        
-                        if split_dur > 0 and actual_dist_mi > 0:
-                            if is_cycling:
-                                speed = actual_dist_mi / (split_dur / 3600)
-                                pace_str = f"{speed:.1f} mph"
-                            else:
-                                pace_val = split_dur / actual_dist_mi
-                                pace_str = f"{int(pace_val//60)}:{int(pace_val%60):02d}"
-
-                            splits.append({
-                                'mile': round(next_split_dist / mile_in_m, 0) if not is_cycling or (next_split_dist / mile_in_m) % 1 == 0 else round(next_split_dist / mile_in_m, 1),
-                                'duration': split_dur,
-                                'pace_str': pace_str
-                            })
-                        last_dur = curr_dur
-                        last_dist = curr_dist
-                        # Ensure we move to the next boundary even if we jumped multiple
-                        while next_split_dist <= curr_dist:
-                            next_split_dist += split_len * mile_in_m
+                    split_dur = curr_dur - last_dur
+                    actual_dist_m = curr_dist - last_dist
+                    actual_dist_mi = actual_dist_m / mile_in_m
+                    
+                    if split_dur > 0 and actual_dist_mi > 0:
+                        if is_cycling:
+                            speed = actual_dist_mi / (split_dur / 3600)
+                            pace_str = f"{speed:.1f} mph"
+                        else:
+                            pace_val = split_dur / actual_dist_mi
+                            pace_str = f"{int(pace_val//60)}:{int(pace_val%60):02d}"
+
+                        splits.append({
+                            'mile': round(next_split_dist / mile_in_m, 0) if not is_cycling or (next_split_dist / mile_in_m) % 1 == 0 else round(next_split_dist / mile_in_m, 1),
+                            'duration': split_dur,
+                            'pace_str': pace_str
+                        })
+                    last_dur = curr_dur
+                    last_dist = curr_dist
+                    # Ensure we move to the next boundary even if we jumped multiple
+                    while next_split_dist <= curr_dist:
+                        next_split_dist += split_len * mile_in_m
+                    i = bisect_left(reach, next_split_dist, i + 1)
                 
                 # Final partial split
                 if total_dist_m and total_dist_m > last_dist:
@@ -3026,9 +3924,11 @@ def get_activity_details(activity_id):
         logger.info(f"Activity {activity_id}: found {len(splits)} splits, dist {total_dist_m}m, dur {total_dur_s}s")
 
         # Prepare polyline from the SAME metrics used for charts to ensure 1:1 synchronization
-        lat_col = [get_val(m.get('metrics', {}), 'directLatitude') for m in metrics_list]
-        lon_col = [get_val(m.get('metrics', {}), 'directLongitude') for m in metrics_list]
-        compact_poly = [[lat, lon] if lat is not None else None for lat, lon in zip(lat_col, lon_col)]
+        lat_col = column('directLatitude')
+        lon_col = column('directLongitude')
+        # 5 decimals is ~1 m, well under GPS error, and trims the largest array in the payload
+        # Same `keep` rows as the charts, so a chart index and a polyline index always name the same sample
+        compact_poly = [[round(lat_col[i], 5), round(lon_col[i], 5)] if lat_col[i] is not None and lon_col[i] is not None else None for i in keep]
 
         # Fetch exercise sets for strength activities
         exercise_sets = None
@@ -3114,14 +4014,32 @@ def add_weight():
 @login_required
 def get_food_logs():
     all_logs = request.args.get('all') == 'true'
-    logs = load_json(FOOD_LOGS_FILE, [])
     
     if all_logs:
-        return jsonify(logs)
+        return jsonify(load_food_logs())
         
     date_str = request.args.get('date', get_today().isoformat())
-    day_logs = [log for log in logs if log['date'] == date_str]
-    return jsonify(day_logs)
+    return jsonify(food_logs_by_date().get(date_str, []))
+
+def food_key(name):
+    return ' '.join(name.lower().split())
+
+def get_cached_nutrition(key):
+    hit = load_json_cached(NUTRITION_CACHE_FILE, {}).get(key)
+    if hit and time.time() - hit['timestamp'] < NUTRITION_CACHE_TTL:
+        return hit['data']
+    return None
+
+def cache_nutrition(estimates_by_key):
+    """Persist fresh AI estimates so repeat foods skip the Gemini call; evicts the oldest past NUTRITION_CACHE_MAX."""
+    cache = dict(load_json_cached(NUTRITION_CACHE_FILE, {}))
+    now = time.time()
+    for key, est in estimates_by_key.items():
+        cache[key] = {'data': est, 'timestamp': now}
+    if len(cache) > NUTRITION_CACHE_MAX:
+        newest = sorted(cache.items(), key=lambda kv: kv[1]['timestamp'])[-NUTRITION_CACHE_MAX:]
+        cache = dict(newest)
+    save_json(NUTRITION_CACHE_FILE, cache)
 
 @app.route('/api/nutrition/log', methods=['POST'])
 @login_required
@@ -3132,48 +4050,60 @@ def log_food():
         return jsonify({'error': 'Food name required'}), 400
     
     # Support multiple food items separated by commas
-    items_to_log = [i.strip() for i in raw_name.split(',')]
+    items_to_log = [name for name in (i.strip() for i in raw_name.split(',')) if name]
     logged_entries = []
     
     date_str = data.get('date', get_today().isoformat())
     time_str = data.get('time', datetime.now(EST).strftime('%H:%M'))
+    base_ms = int(time.time() * 1000) # ids are base_ms + position in this request
     custom_foods = load_json(CUSTOM_FOODS_FILE, {})
     
-    ai_items = []
+    ai_items = {} # food_key -> name as typed, so repeats within one request are asked about once
+    pending = []
     for name in items_to_log:
         if name in custom_foods:
             nutrition = custom_foods[name]
             log_entry = {
-                'id': int(time.time() * 1000) + len(logged_entries),
+                'id': base_ms + len(logged_entries),
                 'date': date_str,
                 'time': time_str,
                 'name': name,
                 **nutrition
             }
             logged_entries.append(log_entry)
+            continue
+        key = food_key(name)
+        cached = get_cached_nutrition(key)
+        if cached:
+            logged_entries.append({
+                'id': base_ms + len(logged_entries),
+                'date': date_str,
+                'time': time_str,
+                **cached
+            })
         else:
-            ai_items.append(name)
+            ai_items.setdefault(key, name)
+            pending.append(key)
             
     if ai_items:
         try:
-            ai_client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+            ai_client = get_genai_client()
             settings = load_settings()
             model_name = settings.get('ai_model', 'gemini-2.0-flash-exp')
             
-            prompt = f"""
-            Analyze these food items: {", ".join(ai_items)}
-            My Goals: Weight loss, low cholesterol.
-            Return ONLY a JSON array of objects, one for each item, with:
-            name (string), calories (int), cholesterol_mg (int), protein_g (int), carbs_g (int), sugar_g (int), fat_g (int), caffeine_mg (int), ai_note (str).
-            """
+            prompt = FOOD_ESTIMATE_PROMPT.format(items=", ".join(ai_items.values()))
             
             response = ai_client.models.generate_content(model=model_name, contents=prompt)
-            clean_text = response.text.replace('```json', '').replace('```', '').strip()
-            estimates = json.loads(clean_text)
+            estimates = parse_ai_json_array(response.text)
+            
+            if len(estimates) == len(ai_items):
+                by_key = dict(zip(ai_items, estimates))
+                cache_nutrition(by_key)
+                estimates = [by_key[k] for k in pending]
             
             for est in estimates:
                 log_entry = {
-                    'id': int(time.time() * 1000) + len(logged_entries),
+                    'id': base_ms + len(logged_entries),
                     'date': date_str,
                     'time': time_str,
                     **est
@@ -3181,30 +4111,28 @@ def log_food():
                 logged_entries.append(log_entry)
         except Exception as e:
             logger.error(f"Bulk AI estimation failed: {e}")
-            for name in ai_items:
+            for key in pending:
                 logged_entries.append({
-                    'id': int(time.time() * 1000) + len(logged_entries),
-                    'date': date_str, 'time': time_str, 'name': name,
+                    'id': base_ms + len(logged_entries),
+                    'date': date_str, 'time': time_str, 'name': ai_items[key],
                     'calories': 0, 'cholesterol_mg': 0, 'protein_g': 0, 'carbs_g': 0, 'sugar_g': 0, 'fat_g': 0, 'caffeine_mg': 0, 'ai_note': 'Failed'
                 })
 
     dry_run = request.args.get('dry_run') == 'true'
     if not dry_run:
-        logs = load_json(FOOD_LOGS_FILE, [])
-        logs.extend(logged_entries)
-        save_json(FOOD_LOGS_FILE, logs)
+        append_food_logs(logged_entries)
     
     return jsonify(logged_entries)
 
-def calculate_nutrition_streak(logs):
-    """Calculate the current consecutive day streak of 'Full Logging' (B/L/D)."""
-    if not logs:
+def calculate_nutrition_streak(logs_by_date):
+    """Calculate the current consecutive day streak of 'Full Logging' (B/L/D) from food_logs_by_date()."""
+    if not logs_by_date:
         return 0, {'breakfast': False, 'lunch': False, 'dinner': False}
 
     today = get_today()
     
     def check_day_complete(date_str):
-        day_logs = [l for l in logs if l.get('date') == date_str and l.get('calories', 0) > 0]
+        day_logs = [l for l in logs_by_date.get(date_str, ()) if l.get('calories', 0) > 0]
         b = any(4 <= int(l.get('time', '00:00').split(':')[0]) < 11 for l in day_logs)
         l_en = any(11 <= int(l.get('time', '00:00').split(':')[0]) < 16 for l in day_logs)
         d = any(16 <= int(l.get('time', '00:00').split(':')[0]) <= 23 for l in day_logs)
@@ -3236,8 +4164,7 @@ def calculate_nutrition_streak(logs):
 @app.route('/api/nutrition/streak')
 @login_required
 def get_nutrition_streak_api():
-    logs = load_json(FOOD_LOGS_FILE, [])
-    streak, progress = calculate_nutrition_streak(logs)
+    streak, progress = calculate_nutrition_streak(food_logs_by_date())
     return jsonify({
         'streak': streak,
         'today_progress': progress,
@@ -3248,10 +4175,11 @@ def get_nutrition_streak_api():
 @login_required
 def get_proactive_suggestions():
     """Analyze history and current state to provide frictionless logging options."""
-    logs = load_json(FOOD_LOGS_FILE, [])
+    logs = load_food_logs()
+    logs_by_date = food_logs_by_date()
     custom = load_json(CUSTOM_FOODS_FILE, {})
     
-    streak, progress = calculate_nutrition_streak(logs)
+    streak, progress = calculate_nutrition_streak(logs_by_date)
     
     # 1. Frequent Items (Top 8)
     all_names = [l.get('name') for l in logs if l.get('name')]
@@ -3261,13 +4189,13 @@ def get_proactive_suggestions():
     
     # 2. Yesterday's Meals
     yesterday_str = (get_today() - timedelta(days=1)).isoformat()
-    yesterday_meals = [l for l in logs if l.get('date') == yesterday_str]
+    yesterday_meals = logs_by_date.get(yesterday_str, [])
     
     # 3. Smart Nudges
     now_est = datetime.now(EST)
     current_hour = now_est.hour
     today_str = get_today().isoformat()
-    today_logs = [l for l in logs if l.get('date') == today_str]
+    today_logs = logs_by_date.get(today_str, [])
     today_names = [l.get('name', '').lower() for l in today_logs]
     
     nudges = []
@@ -3323,9 +4251,7 @@ def get_proactive_suggestions():
 def copy_yesterday_meal():
     """Copy a specific log entry from yesterday to today at the current time."""
     log_id = request.json.get('id')
-    logs = load_json(FOOD_LOGS_FILE, [])
-    
-    source_entry = next((l for l in logs if l.get('id') == log_id), None)
+    source_entry = food_logs_by_id().get(log_id)
     if not source_entry:
         return jsonify({'error': 'Source log not found'}), 404
         
@@ -3334,17 +4260,15 @@ def copy_yesterday_meal():
     new_entry['date'] = get_today().isoformat()
     new_entry['time'] = datetime.now(EST).strftime('%H:%M')
     
-    logs.append(new_entry)
-    save_json(FOOD_LOGS_FILE, logs)
+    append_food_logs([new_entry])
     return jsonify({'status': 'success', 'entry': new_entry})
 
 @app.route('/api/nutrition/delete', methods=['POST'])
 @login_required
 def delete_food_log():
     log_id = request.json.get('id')
-    logs = load_json(FOOD_LOGS_FILE, [])
-    new_logs = [l for l in logs if l.get('id') != log_id]
-    save_json(FOOD_LOGS_FILE, new_logs)
+    if log_id in food_logs_by_id():
+        append_food_logs([{'_tomb': log_id}])
     return jsonify({'status': 'success'})
 
 @app.route('/api/nutrition/custom_foods', methods=['GET', 'POST'])
@@ -3382,12 +4306,12 @@ def nutrition_chat():
         image_b64 = data.get('image')
         current_items = data.get('current_items', [])
         
-        ai_client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+        ai_client = get_genai_client()
         settings = load_settings()
         model_name = settings.get('ai_model', 'gemini-2.0-flash-exp')
         
         # Provide context on recent meals for 'treat frequency' tips
-        logs = load_json(FOOD_LOGS_FILE, [])
+        logs = load_food_logs()
         recent_meals = [l.get('name') for l in logs[-15:]] # last 15 items
         
         prompt = f"""
@@ -3421,8 +4345,7 @@ def nutrition_chat():
             contents.append(genai.Part.from_bytes(data=img_data, mime_type="image/jpeg"))
 
         response = ai_client.models.generate_content(model=model_name, contents=contents)
-        clean_text = response.text.replace('```json', '').replace('```', '').strip()
-        result = json.loads(clean_text)
+        result = parse_ai_json_object(response.text)
         
         return jsonify(result)
     except Exception as e:
@@ -3449,107 +4372,97 @@ def estimate_ingredients():
         return jsonify({'error': 'Ingredients required'}), 400
         
     try:
-        ai_client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+        ai_client = get_genai_client()
         settings = load_settings()
         model_name = settings.get('ai_model', 'gemini-2.0-flash-exp')
         
         ing_list_str = "\n".join([f"- {i['qty']} {i['unit']} of {i['name']}" for i in ingredients])
         
-        prompt = f"""
-        Estimate nutritional values for these ingredients collectively and individually:
-        {ing_list_str}
-        
-        Return ONLY a JSON array where each object corresponds to an ingredient and has:
-        calories (int), cholesterol_mg (int), protein_g (int), carbs_g (int), sugar_g (int), fat_g (int), caffeine_mg (int).
-        """
+        prompt = INGREDIENT_ESTIMATE_PROMPT.format(ingredients=ing_list_str)
         
         response = ai_client.models.generate_content(model=model_name, contents=prompt)
-        clean_text = response.text.replace('```json', '').replace('```', '').strip()
-        result = json.loads(clean_text)
+        result = parse_ai_json_array(response.text)
         return jsonify(result)
     except Exception as e:
         logger.error(f"Bulk ingredient estimation failed: {e}")
         return jsonify({'error': str(e)}), 500
 
+def stream_csv(header, rows, filename):
+    """CSV download sent row by row as it is produced, rather than built up in one StringIO."""
+    def generate():
+        buf = io.StringIO()
+        cw = csv.writer(buf)
+        cw.writerow(header)
+        for row in rows:
+            cw.writerow(row)
+            if buf.tell() > 8192:
+                yield buf.getvalue()
+                buf.seek(0)
+                buf.truncate()
+        yield buf.getvalue()
+    return Response(generate(), mimetype='text/csv', headers={'Content-Disposition': f"attachment; filename={filename}"})
+
 @app.route('/api/nutrition/export_library')
 @login_required
 def export_library_csv():
-    import csv
-    import io
-    from flask import make_response
-    
     library = load_json(CUSTOM_FOODS_FILE, {})
-    si = io.StringIO()
-    cw = csv.writer(si)
-    cw.writerow(['Name', 'Category', 'Calories', 'Cholesterol (mg)', 'Protein (g)', 'Carbs (g)', 'Sugar (g)', 'Fat (g)', 'Caffeine (mg)', 'Ingredients'])
+    header = ['Name', 'Category', 'Calories', 'Cholesterol (mg)', 'Protein (g)', 'Carbs (g)', 'Sugar (g)', 'Fat (g)', 'Caffeine (mg)', 'Ingredients']
     
-    for name, data in library.items():
-        ings = data.get('ingredients') or []
-        ing_list = "; ".join([f"{i.get('qty','0')} {i.get('unit','pcs')} {i.get('name','Item')}" for i in ings])
-        cw.writerow([
-            name,
-            data.get('category'),
-            data.get('calories'),
-            data.get('cholesterol_mg'),
-            data.get('protein_g'),
-            data.get('carbs_g'),
-            data.get('sugar_g'),
-            data.get('fat_g'),
-            data.get('caffeine_mg'),
-            ing_list
-        ])
+    def rows():
+        for name, data in library.items():
+            ings = data.get('ingredients') or []
+            ing_list = "; ".join([f"{i.get('qty','0')} {i.get('unit','pcs')} {i.get('name','Item')}" for i in ings])
+            yield [
+                name,
+                data.get('category'),
+                data.get('calories'),
+                data.get('cholesterol_mg'),
+                data.get('protein_g'),
+                data.get('carbs_g'),
+                data.get('sugar_g'),
+                data.get('fat_g'),
+                data.get('caffeine_mg'),
+                ing_list
+            ]
     
-    output = make_response(si.getvalue())
-    output.headers["Content-Disposition"] = "attachment; filename=food_library.csv"
-    output.headers["Content-Type"] = "text/csv"
-    return output
+    return stream_csv(header, rows(), "food_library.csv")
 
 
 @app.route('/api/nutrition/export')
 @login_required
 def export_logs_csv():
-    import csv
-    import io
-    from flask import make_response
-    
-    logs = load_json(FOOD_LOGS_FILE, [])
-    si = io.StringIO()
-    cw = csv.writer(si)
+    # Rows stay in log order, so a re-import reproduces the file as it was
+    logs = load_food_logs()
     # Header matching the user's request for "exact same format" for re-import
-    cw.writerow(['Date', 'Time', 'Name', 'Calories', 'Cholesterol (mg)', 'Protein (g)', 'Carbs (g)', 'Sugar (g)', 'Fat (g)', 'Caffeine (mg)', 'Category', 'Ingredients', 'AI Note'])
+    header = ['Date', 'Time', 'Name', 'Calories', 'Cholesterol (mg)', 'Protein (g)', 'Carbs (g)', 'Sugar (g)', 'Fat (g)', 'Caffeine (mg)', 'Category', 'Ingredients', 'AI Note']
     
-    for log in logs:
-        # Flatten ingredients if present
-        ing_data = log.get('ingredients', [])
-        ing_str = "; ".join([f"{i.get('qty','')} {i.get('unit','')} {i.get('name','')}" for i in ing_data]) if ing_data else ""
-        
-        cw.writerow([
-            log.get('date', ''),
-            log.get('time', ''),
-            log.get('name', ''),
-            log.get('calories', 0),
-            log.get('cholesterol_mg', 0),
-            log.get('protein_g', 0),
-            log.get('carbs_g', 0),
-            log.get('sugar_g', 0),
-            log.get('fat_g', 0),
-            log.get('caffeine_mg', 0),
-            log.get('category', ''),
-            ing_str,
-            log.get('ai_note', '')
-        ])
+    def rows():
+        for log in logs:
+            # Flatten ingredients if present
+            ing_data = log.get('ingredients', [])
+            ing_str = "; ".join([f"{i.get('qty','')} {i.get('unit','')} {i.get('name','')}" for i in ing_data]) if ing_data else ""
+            
+            yield [
+                log.get('date', ''),
+                log.get('time', ''),
+                log.get('name', ''),
+                log.get('calories', 0),
+                log.get('cholesterol_mg', 0),
+                log.get('protein_g', 0),
+                log.get('carbs_g', 0),
+                log.get('sugar_g', 0),
+                log.get('fat_g', 0),
+                log.get('caffeine_mg', 0),
+                log.get('category', ''),
+                ing_str,
+                log.get('ai_note', '')
+            ]
     
-    output = make_response(si.getvalue())
-    output.headers["Content-Disposition"] = f"attachment; filename=food_logs_{get_today()}.csv"
-    output.headers["Content-Type"] = "text/csv"
-    return output
+    return stream_csv(header, rows(), f"food_logs_{get_today()}.csv")
 
 @app.route('/api/nutrition/import', methods=['POST'])
 @login_required
 def import_logs_csv():
-    import csv
-    import io
-    
     if 'file' not in request.files:
         return jsonify({'error': 'No file part'}), 400
     file = request.files['file']
@@ -3565,7 +4478,7 @@ def import_logs_csv():
         # Expected: Date, Time, Name, Calories, Cholesterol (mg), Protein (g), Carbs (g), Fat (g), Category, Ingredients, AI Note
         
         new_logs = []
-        current_logs = load_json(FOOD_LOGS_FILE, [])
+        current_logs = load_food_logs()
         existing_ids = {l['id'] for l in current_logs} # Although we generate new IDs, we could check for duplicates based on content?
         # For now, just append. User said "pick up where I left off", implies filling gaps or restoring.
         
@@ -3610,8 +4523,7 @@ def import_logs_csv():
                 logger.warning(f"Error parsing CSV row {i}: {e}")
                 continue
                 
-        current_logs.extend(new_logs)
-        save_json(FOOD_LOGS_FILE, current_logs)
+        append_food_logs(new_logs)
         
         return jsonify({'status': 'success', 'count': len(new_logs)})
         
@@ -3621,14 +4533,20 @@ def import_logs_csv():
 
     
 
+# Gemini nutrition analyses keyed on everything the advice depends on (LRU, short TTL)
+NUTRITION_ANALYSIS_CACHE_TTL = 600 # 10 Minutes
+NUTRITION_ANALYSIS_CACHE_MAX = 256
+nutrition_analysis_cache = OrderedDict()
+nutrition_analysis_lock = threading.Lock()
+
 @app.route('/api/nutrition/analysis')
 @login_required
 def get_nutrition_analysis():
     date_str = request.args.get('date', get_today().isoformat())
     
     # Get intakes
-    logs = load_json(FOOD_LOGS_FILE, [])
-    day_logs = [log for log in logs if log['date'] == date_str]
+    logs_by_date = food_logs_by_date()
+    day_logs = logs_by_date.get(date_str, [])
     total_in = sum(l.get('calories', 0) for l in day_logs)
     total_chol = sum(l.get('cholesterol_mg', 0) for l in day_logs)
 
@@ -3639,7 +4557,7 @@ def get_nutrition_analysis():
     history_summary = []
     for i in range(7):
         d = (seven_days_ago + timedelta(days=i)).isoformat()
-        daily_sum = sum(l.get('calories', 0) for l in logs if l['date'] == d)
+        daily_sum = sum(l.get('calories', 0) for l in logs_by_date.get(d, ()))
         history_summary.append(f"{d}: {daily_sum} kcal")
     
     history_str = ", ".join(history_summary)
@@ -3651,24 +4569,29 @@ def get_nutrition_analysis():
     total_out = cal_data['total']
     active_out = cal_data['active']
     resting_out = cal_data['resting']
+    metabolic = {
+        'total': total_out,
+        'resting': resting_out,
+        'active': active_out
+    }
     
     # Check for no_ai flag
     if request.args.get('no_ai') == 'true':
         return jsonify({
             'analysis': "Detailed analysis available on request.",
-            'metabolic': {
-                'total': total_out,
-                'resting': resting_out,
-                'active': active_out
-            }
+            'metabolic': metabolic
         })
     
     try:
-        ai_client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+        ai_client = get_genai_client()
         settings = load_settings()
         model_name = settings.get('ai_model', 'gemini-2.0-flash-exp')
         
-        food_list = ", ".join([l['name'] for l in day_logs]) or "No food logged yet."
+        food_names = [l['name'] for l in day_logs[-NUTRITION_ANALYSIS_MAX_FOODS:]]
+        skipped = len(day_logs) - len(food_names)
+        food_list = ", ".join(food_names) or "No food logged yet."
+        if skipped:
+            food_list = f"{food_list} (+{skipped} earlier items)"
 
         # 1. Define the current status based on time
         now_est = datetime.now(EST)
@@ -3687,80 +4610,38 @@ def get_nutrition_analysis():
             meals_remaining = "potentially a late snack or the day is concluding"
             time_context = "evening"
         
-        prompt = f"""
-        You are 'Athlete Intelligence', a supportive but strict sports coach. Analyze my nutrition for {date_str} with a "Performance Fueling" perspective.
-        My Goals: Weight loss, low cholesterol.
-        
-        Metabolic Data:
-        - Total Energy Out: {total_out} kcal (Resting: {resting_out}, Active: {active_out})
-        - Total Energy In: {total_in} kcal
-        - Total Cholesterol: {total_chol} mg
-        - Logged Foods: {food_list}
-
-        7-Day Calorie History (for trend analysis): {history_str}
-        
-        - Address me directly as 'you'. 
-        - I still have {meals_remaining} expected for the rest of the day since it is {time_str}.
-        - DO NOT praise a 'significant deficit' as an achievement if the day is not over; frame it as 'Available Fuel Capacity'.
-        - Focus on Performance Fueling: directly tie my active calories to my food intake (e.g., "You burned 1,200 calories riding today; ensure your next meal has heavy carbs to replenish glycogen"). Be strict if I am eating junk while trying to fuel performance.
-
-        Return plain text (no markdown blocks or JSON formatting). We will inject it directly as HTML.
-        Please structure your response as:
-        2-3 sentences analyzing energy balance and cholesterol. Explicitly point out if yesterday affected today. <br><br><strong>Action Plan:</strong> 1-2 sharp, strict sentences of advice for my next meal or rest of day.
-        """
+        # Same numbers, foods and part of day -> same advice; skip the multi-second model call
+        cache_key = (date_str, model_name, total_in, total_chol, total_out, resting_out, active_out, food_list, history_str, time_context)
+        now = time.time()
+        with nutrition_analysis_lock:
+            hit = nutrition_analysis_cache.get(cache_key)
+            if hit and now - hit['timestamp'] < NUTRITION_ANALYSIS_CACHE_TTL:
+                nutrition_analysis_cache.move_to_end(cache_key)
+                return jsonify({'analysis': hit['data'], 'metabolic': metabolic})
+        
+        prompt = NUTRITION_ANALYSIS_PROMPT.format(
+            date_str=date_str, total_out=total_out, resting_out=resting_out, active_out=active_out,
+            total_in=total_in, total_chol=total_chol, food_list=food_list, history_str=history_str,
+            meals_remaining=meals_remaining, time_str=time_str
+        )
         
         response = ai_client.models.generate_content(model=model_name, contents=prompt)
+        with nutrition_analysis_lock:
+            nutrition_analysis_cache[cache_key] = {'data': response.text, 'timestamp': now}
+            nutrition_analysis_cache.move_to_end(cache_key)
+            while len(nutrition_analysis_cache) > NUTRITION_ANALYSIS_CACHE_MAX:
+                nutrition_analysis_cache.popitem(last=False)
         return jsonify({
             'analysis': response.text,
-            'metabolic': {
-                'total': total_out,
-                'resting': resting_out,
-                'active': active_out
-            }
+            'metabolic': metabolic
         })
     except Exception as e:
         logger.error(f"Nutrition analysis failed: {e}")
         return jsonify({
             'analysis': "Athlete Intelligence is currently refining your metabolic insights.",
-            'metabolic': {
-                'total': total_out,
-                'resting': resting_out,
-                'active': active_out
-            }
+            'metabolic': metabolic
         })
 
-@app.route('/api/nutrition/export')
-@login_required
-def export_food_csv():
-    import csv
-    import io
-    from flask import make_response
-    
-    logs = load_json(FOOD_LOGS_FILE, [])
-    # Sort by date and time
-    logs.sort(key=lambda x: (x['date'], x['time']))
-    
-    si = io.StringIO()
-    cw = csv.writer(si)
-    cw.writerow(['Date', 'Time', 'Food', 'Calories', 'Cholesterol (mg)', 'Protein (g)', 'Carbs (g)', 'Fat (g)'])
-    
-    for l in logs:
-        cw.writerow([
-            l.get('date'),
-            l.get('time'),
-            l.get('name'),
-            l.get('calories'),
-            l.get('cholesterol_mg'),
-            l.get('protein_g'),
-            l.get('carbs_g'),
-            l.get('fat_g')
-        ])
-    
-    output = make_response(si.getvalue())
-    output.headers["Content-Disposition"] = "attachment; filename=food_logs.csv"
-    output.headers["Content-Type"] = "text/csv"
-    return output
-
 @app.route('/api/activity_heatmap')
 @login_required
 def get_activity_heatmap():
@@ -3770,125 +4651,120 @@ def get_activity_heatmap():
     if activity_heatmap_cache['data'] and activity_heatmap_cache['timestamp']:
         if now - activity_heatmap_cache['timestamp'] < ACT_HEATMAP_CACHE_EXPIRY:
             logger.info("Heatmap: Returning cached data.")
-            return jsonify(activity_heatmap_cache['data'])
+            return cached_json_response(activity_heatmap_json_memo, activity_heatmap_cache['timestamp'], activity_heatmap_cache['data'])
 
     try:
         client = get_garmin_client()
-        today = get_today()
-        start_date = today - timedelta(days=366)
-        
-        # 1. Attempt date-range fetch (more precise for exactly 1 year)
-        start_str = start_date.isoformat()
-        end_str = today.isoformat()
-        logger.info(f"Heatmap: Attempting date-range fetch from {start_str} to {end_str}")
-        
-        activities = []
-        try:
-            activities = garmin_request(client.get_activities_by_date, start_str, end_str)
-        except Exception as e:
-            logger.warning(f"Heatmap: get_activities_by_date failed: {e}. Falling back...")
-
-        # 2. Fallback to count-based fetch if empty or failed
-        if not activities:
-            logger.info("Heatmap: No activities from date-range. Fetching last 1000...")
-            activities = garmin_request(client.get_activities, 0, 1000)
-        
-        logger.info(f"Heatmap: Found {len(activities) if activities else 0} total activities to process.")
-        
-        heatmap = {}
-        for activity in activities:
-            if not activity: continue
-            start_local = activity.get('startTimeLocal')
-            if start_local and len(start_local) >= 10:
-                # Robust date extraction: first 10 characters are YYYY-MM-DD
-                date_str = start_local[:10]
-                
-                if date_str not in heatmap:
-                    heatmap[date_str] = []
-                
-                # Extract distance and duration safely
-                raw_dist = activity.get('distance')
-                raw_dur = activity.get('duration')
-                
-                dist_mi = round(n(raw_dist) / 1609.34, 1)
-                dur_m = round(n(raw_dur) / 60)
-                
-                # Add a succinct summary for the UI tooltip
-                heatmap[date_str].append({
-                    'name': activity.get('activityName', 'Activity'),
-                    'type': activity.get('activityType', {}).get('typeKey', 'other'),
-                    'dist': dist_mi,
-                    'dur': dur_m
-                })
+        refresh_activity_heatmap(client)
+        heatmap = activity_heatmap_cache['data']
 
         # Debug: Log a few keys to verify format
         if heatmap:
             sample_keys = list(heatmap.keys())[:3]
             logger.info(f"Heatmap: Generated {len(heatmap)} date keys. Samples: {sample_keys}")
 
-        # Final Cache Commit
-        activity_heatmap_cache['data'] = heatmap
-        activity_heatmap_cache['timestamp'] = now
         return jsonify(heatmap)
 
     except Exception as e:
         logger.error(f"Error fetching activity heatmap: {e}")
         return jsonify({'error': str(e)}), 500
 
+# Calendar views re-request the same week/month as the user pages back and forth
+CALENDAR_CACHE_TTL = 300 # 5 Minutes
+CALENDAR_CACHE_MAX = 128
+calendar_cache = OrderedDict() # (start, end) -> {'data': encoded body, 'timestamp'}
+calendar_lock = threading.Lock()
+
 @app.route('/api/calendar_activities')
 @login_required
 def get_calendar_activities():
     try:
-        client = get_garmin_client()
         start = request.args.get('start_date')
         end = request.args.get('end_date')
         
         if not start or not end:
             return jsonify({'error': 'Start and End dates required'}), 400
-            
-        activities = client.get_activities_by_date(start, end)
-        return jsonify(activities)
+        
+        key = (start, end)
+        now = time.time()
+        with calendar_lock:
+            entry = calendar_cache.get(key)
+            if entry and now - entry['timestamp'] < CALENDAR_CACHE_TTL:
+                calendar_cache.move_to_end(key)
+            else:
+                entry = None
+        
+        if entry is None:
+            client = get_garmin_client()
+            activities = garmin_request(client.get_activities_by_date, start, end)
+            entry = {'data': orjson.dumps(activities, option=RESPONSE_ORJSON_OPTS, default=app.json.default), 'timestamp': now}
+            with calendar_lock:
+                calendar_cache[key] = entry
+                calendar_cache.move_to_end(key)
+                while len(calendar_cache) > CALENDAR_CACHE_MAX:
+                    calendar_cache.popitem(last=False)
+        
+        # ETag over the body: an unchanged week answers If-None-Match with a bodiless 304
+        resp = app.response_class(entry['data'], mimetype='application/json')
+        resp.add_etag()
+        resp.headers['Cache-Control'] = f'private, max-age={CALENDAR_CACHE_TTL}'
+        return resp.make_conditional(request)
 
     except Exception as e:
         logger.error(f"Error fetching calendar activities: {e}")
         return jsonify({'error': str(e)}), 500
 
+def page_heatmap_result(result, types=None, limit=None, cursor=None):
+    """Optional server-side narrowing of a /api/heatmap_data result.
+
+    types: comma-separated activityType.typeKeys to keep. limit/cursor page through the routes
+    newest activity id first; cursor is the last id of the previous page (next_cursor).
+    Without any of them the full result is returned unchanged.
+    """
+    if not (types or limit or cursor):
+        return result
+    points = result['data']
+    if types:
+        type_set = frozenset(t.strip() for t in types.split(','))
+        points = [p for p in points if p['type'] in type_set]
+    points = sorted(points, key=lambda p: p['id'], reverse=True)
+    start = 0
+    if cursor:
+        start = next((i for i, p in enumerate(points) if p['id'] < cursor), len(points))
+    end = start + max(1, limit) if limit else len(points)
+    page = points[start:end]
+    has_more = end < len(points)
+    return {
+        **result,
+        'count': len(page),
+        'data': page,
+        'next_cursor': page[-1]['id'] if has_more and page else None,
+        'has_more': has_more
+    }
+
 @app.route('/api/heatmap_data')
 @login_required
 def get_heatmap_data():
     global heatmap_cache
     range_val = request.args.get('range', 'this_year')
+    types = request.args.get('types')
+    limit = request.args.get('limit', type=int)
+    cursor = request.args.get('cursor', type=int)
     now = time.time()
     
+    # The cache always holds the full range; type filters and pages are cut from it per request
     if heatmap_cache['data'] and heatmap_cache['range'] == range_val:
         # Use shorter cache when actively syncing routes
         cache_ttl = HEATMAP_CACHE_EXPIRY_SYNCING if (heatmap_cache['data'] or {}).get('missing_count', 0) > 0 else HEATMAP_CACHE_EXPIRY
         if now - heatmap_cache['timestamp'] < cache_ttl:
-            return jsonify(heatmap_cache['data'])
+            if not (types or limit or cursor):
+                return cached_json_response(heatmap_json_memo, (range_val, heatmap_cache['timestamp']), heatmap_cache['data'])
+            return jsonify(page_heatmap_result(heatmap_cache['data'], types, limit, cursor))
 
     try:
         client = get_garmin_client()
         
-        today = get_today()
-        if range_val == 'this_year':
-            start_date = date(today.year, 1, 1)
-        elif range_val == 'this_month':
-            start_date = date(today.year, today.month, 1)
-        elif range_val == 'last_month':
-            first_this_month = date(today.year, today.month, 1)
-            end_date = first_this_month - timedelta(days=1)
-            start_date = date(end_date.year, end_date.month, 1)
-        elif range_val == 'last_year':
-            start_date = date(today.year - 1, 1, 1)
-            end_date = date(today.year - 1, 12, 31) # Correctly set end date
-        elif range_val == 'all':
-            start_date = date(2010, 1, 1) # Start from 2010 per user request
-        else:
-            start_date = today - timedelta(days=90)
-            
-        # Standard flow covers until today unless overridden
-        if range_val not in ['last_year', 'last_month']:
-            end_date = today
+        start_date, end_date = resolve_heatmap_range(range_val, get_today())
 
         # 1. Fetch Activity List (Summary)
         # Note: get_activities matches by count, get_activities_by_date matches by date
@@ -3903,7 +4779,7 @@ def get_heatmap_data():
         
         for act in activities:
             aid = act.get('activityId')
-            type_key = act.get('activityType', {}).get('typeKey', 'unknown') or 'unknown'
+            type_key = type_key_of(act, 'unknown')
             
             # Debug: track type distribution
             type_counter[type_key] = type_counter.get(type_key, 0) + 1
@@ -3927,27 +4803,13 @@ def get_heatmap_data():
 
         # 3. Trigger Background Fill if needed
         if missing_ids:
-            global fetch_generation, active_fetch_range, is_fetching
-            
+            # Single flight per range: switching ranges leaves the other range's fetcher running
             with fetch_lock:
-                if range_val != active_fetch_range:
-                    fetch_generation += 1
-                    active_fetch_range = range_val
-                    is_fetching = True
-                    current_gen = fetch_generation
-                    
-                    logger.info(f"New range '{range_val}': cancelling old, starting gen:{current_gen} for {len(missing_ids)} items.")
-                    # Use a lock to ensure only one fetcher runs at a time globally
-                    thread = threading.Thread(target=background_polyline_fetcher, args=(client, missing_ids, current_gen))
-                    thread.daemon = True
-                    thread.start()
-                elif not is_fetching:
-                    is_fetching = True
-                    current_gen = fetch_generation
-                    logger.info(f"Range '{range_val}' active but no worker. Spawning gen:{current_gen} for {len(missing_ids)} items.")
-                    thread = threading.Thread(target=background_polyline_fetcher, args=(client, missing_ids, current_gen))
-                    thread.daemon = True
-                    thread.start()
+                state = fetch_ranges.get(range_val)
+                if not (state and state['fetching']):
+                    current_gen = begin_fetch_generation(range_val)
+                    logger.info(f"Range '{range_val}' has no worker. Spawning gen:{current_gen} for {len(missing_ids)} items.")
+                    polyline_fetch_pool.submit(background_polyline_fetcher, client, missing_ids, range_val, current_gen)
             
         result = {
             'count': len(result_points),
@@ -3961,7 +4823,7 @@ def get_heatmap_data():
         heatmap_cache['timestamp'] = time.time()
         heatmap_cache['range'] = range_val
         
-        return jsonify(result)
+        return jsonify(page_heatmap_result(result, types, limit, cursor))
 
     except Exception as e:
         logger.error(f"Error serving heatmap data: {e}")
@@ -203,7 +203,9 @@ window.renderActivityHeatmap = function (data) {
 
     while (current <= today || current.getDay() !== 1) {
         const dStr = window.getLocalDateStr(current);
-        const dayActivities = data[dStr] || [];
+        // Days arrive column-wise ({name: [], type: [], dist: [], dur: []}); zip them back into activities
+        const cols = data[dStr];
+        const dayActivities = cols ? cols.name.map((name, i) => ({ name, type: cols.type[i], dist: cols.dist[i], dur: cols.dur[i] })) : [];
 
         currentWeek.push({
             date: new Date(current),
@@ -0,0 +1,30 @@
+import os
+import tempfile
+
+import app
+
+
+def test_export_keeps_log_order():
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            app.append_food_logs([
+                {'id': '1', 'date': '2024-01-02', 'time': '08:00', 'name': 'Oats'},
+                {'id': '2', 'date': '2024-01-01', 'time': '19:00', 'name': 'Pasta'},
+                {'id': '3', 'date': '2024-01-02', 'time': '07:00', 'name': 'Coffee'},
+            ])
+            client = app.app.test_client()
+            with client.session_transaction() as s:
+                s['logged_in'] = True
+            resp = client.get('/api/nutrition/export')
+            assert resp.status_code == 200
+            names = [line.split(',')[2] for line in resp.get_data(as_text=True).splitlines()[1:] if line]
+            assert names == ['Oats', 'Pasta', 'Coffee'], names
+        finally:
+            os.chdir(cwd)
+
+
+if __name__ == '__main__':
+    test_export_keeps_log_order()
+    print("test_export: ok")
@@ -0,0 +1,16 @@
+from app import heatmap_minutes
+
+
+def test_heatmap_minutes_matches_round():
+    # .5 boundaries go through round() (half to even), same as the other duration displays
+    assert heatmap_minutes(90) == round(1.5) == 2
+    assert heatmap_minutes(150) == round(2.5) == 2
+    assert heatmap_minutes(1800) == 30
+    assert heatmap_minutes(1829.9) == 30
+    assert heatmap_minutes(None) == 0
+    assert heatmap_minutes(0) == 0
+
+
+if __name__ == '__main__':
+    test_heatmap_minutes_matches_round()
+    print("test_heatmap: ok")
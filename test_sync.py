@@ -0,0 +1,41 @@
+import os
+import tempfile
+from collections import Counter
+from datetime import date
+
+from app import GarminSyncManager, DAILY_ONLY_METRICS
+
+
+class CountingClient:
+    """Stand-in Garmin client that counts calls per (method, date)."""
+    def __init__(self):
+        self.calls = Counter()
+
+    def __getattr__(self, name):
+        def call(*args, **kwargs):
+            self.calls[(name, args[0] if args else None)] += 1
+            return {}
+        return call
+
+
+def test_force_refresh_fetches_each_day_once():
+    start, end = date(2024, 1, 1), date(2024, 1, 5)
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            for metric in DAILY_ONLY_METRICS:
+                client = CountingClient()
+                mgr = GarminSyncManager(client)
+                mgr.get_range(metric, start, end, force_refresh=True)
+                days = {d for (_, d) in client.calls}
+                assert len(days) == 5, (metric, client.calls)
+                # One fetch per day: no client call is repeated for the same date
+                assert max(client.calls.values()) == 1, (metric, client.calls)
+        finally:
+            os.chdir(cwd)
+
+
+if __name__ == '__main__':
+    test_force_refresh_fetches_each_day_once()
+    print("test_sync: ok")